@@ -0,0 +1,205 @@
+import argparse
+import csv
+import json
+import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from capacity import INDEX_FILE, CapacityIndex
+from steganograhpy import PhaseLog, add_phase_hook, file_format, phases_ms, stego_method
+
+
+# Необязательные колонки манифеста, которые передаются в конструктор класса
+OPTION_COLUMNS = ("keystream_mode", "parser", "bits_per_marker", "compression", "compression_level", "engine")
+
+
+def load_manifest(path: str):
+    """Задания из CSV (с заголовком) или JSON (список объектов / JSON Lines).
+
+    Колонки: action (embed|extract|update, по умолчанию embed), method (spaces|zero-width),
+    cover, secret или secret_file, key, output и необязательные OPTION_COLUMNS.
+    Для embed вместо cover можно указать cover_dir - обложку подберет assign_covers.
+    Для extract cover - стего-файл, output - куда сохранить сообщение (можно пусто).
+    Для update cover - стего-файл, куда записывается новое сообщение (output пусто - на месте),
+    old_key - необязательный ключ прежнего сообщения (ускоряет update для пробелов).
+    """
+    ext = os.path.splitext(path)[1].lower()
+    with open(path, "r", encoding="utf-8") as f:
+        if ext == ".csv":
+            jobs = list(csv.DictReader(f))
+        elif ext == ".jsonl":
+            jobs = [json.loads(line) for line in f if line.strip()]
+        else:
+            jobs = json.load(f)
+
+    base = os.path.dirname(os.path.abspath(path))
+    for i, job in enumerate(jobs):
+        job["index"] = i
+        job.setdefault("action", "embed")
+        # Относительные пути считаются от папки манифеста
+        for column in ("cover", "cover_dir", "output", "secret_file"):
+            if job.get(column):
+                job[column] = os.path.join(base, job[column])
+    return jobs
+
+
+def assign_covers(jobs, index_path: str = INDEX_FILE):
+    """Подбирает обложки для заданий embed с cover_dir по индексу емкости (capacity.py).
+
+    Выполняется в основном процессе до запуска пула, чтобы индекс читался и писался один раз.
+    """
+    index = None
+    for job in jobs:
+        if job.get("cover") or not job.get("cover_dir") or job["action"] != "embed":
+            continue
+        if index is None:
+            index = CapacityIndex(index_path)
+        index.parser = job.get("parser") or "html.parser"
+        if job.get("secret_file"):
+            # Размер файла не меньше длины секрета в UTF-8, так что оценка с запасом
+            size = os.path.getsize(job["secret_file"])
+        else:
+            size = len((job.get("secret") or "").encode("utf-8"))
+        # Формат обложки должен совпадать с форматом выходного файла
+        try:
+            fmt = file_format(job.get("output") or "")
+        except ValueError:
+            fmt = None
+        job["cover"] = index.pick([job["cover_dir"]], size, job["method"], int(job.get("bits_per_marker") or 1), fmt)
+    if index is not None:
+        index.save()
+
+
+def run_job(job: dict) -> dict:
+    result = {
+        "index": job["index"],
+        "action": job.get("action") or "embed",
+        "method": job.get("method"),
+        "cover": job.get("cover"),
+        "output": job.get("output"),
+        "ok": False,
+        "error": None,
+        "seconds": 0.0,
+        "bits": 0,
+        "cover_bytes": 0,
+    }
+    start = time.perf_counter()
+    try:
+        if not job.get("cover"):
+            raise ValueError("Не задана обложка (или в cover_dir нет подходящей)")
+        options = {c: job[c] for c in OPTION_COLUMNS if job.get(c)}
+        method = stego_method(job["cover"], job["method"], **options)
+        result["cover_bytes"] = os.path.getsize(job["cover"])
+
+        if result["action"] in ("embed", "update"):
+            secret = job.get("secret")
+            if job.get("secret_file"):
+                with open(job["secret_file"], "r", encoding="utf-8") as f:
+                    secret = f.read()
+            if result["action"] == "embed":
+                _, result["bits"] = method.embed(job["cover"], secret, job["key"], job["output"])
+            else:
+                update_options = {"old_key": job["old_key"]} if job.get("old_key") else {}
+                _, result["bits"], result["changed_nodes"] = method.update(
+                    job["cover"], secret, job["key"], job.get("output") or None, **update_options)
+            result["phases_ms"] = phases_ms(method.last_timing)
+        elif result["action"] == "extract":
+            message, _, result["bits"] = method.extract(job["cover"], job["key"])
+            result["phases_ms"] = phases_ms(method.last_timing)
+            if job.get("output"):
+                with open(job["output"], "w", encoding="utf-8") as f:
+                    f.write(message)
+            else:
+                result["message"] = message
+        else:
+            raise ValueError(f"Неизвестное действие: {result['action']}")
+        result["ok"] = True
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    result["seconds"] = time.perf_counter() - start
+    return result
+
+
+def _init_worker(phase_log: str = None, phase_memory: bool = False):
+    # Хук подписывается в каждом процессе пула: при spawn (Windows, macOS) подписки родителя не наследуются
+    if phase_log:
+        add_phase_hook(PhaseLog(phase_log), phase_memory)
+
+
+def run_batch(jobs, workers: int = None, on_result=None, phase_log: str = None, phase_memory: bool = False):
+    """Выполняет задания в пуле процессов; возвращает (результаты по порядку, сводка).
+
+    phase_log - файл, куда каждый процесс дописывает замеры фаз (см. PhaseLog).
+    Исключение в on_result печатается и не прерывает остальные задания.
+    """
+    if phase_log:
+        PhaseLog(phase_log).write_header()
+    start = time.perf_counter()
+    results = []
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(phase_log, phase_memory)) as pool:
+        futures = [pool.submit(run_job, job) for job in jobs]
+        for future in as_completed(futures):
+            result = future.result()
+            results.append(result)
+            if on_result:
+                try:
+                    on_result(result)
+                except Exception:
+                    traceback.print_exc()
+    wall = time.perf_counter() - start
+
+    results.sort(key=lambda r: r["index"])
+    done = [r for r in results if r["ok"]]
+    bits = sum(r["bits"] for r in done)
+    cover_bytes = sum(r["cover_bytes"] for r in done)
+    summary = {
+        "jobs": len(results),
+        "ok": len(done),
+        "failed": len(results) - len(done),
+        "wall_seconds": wall,
+        "cpu_seconds": sum(r["seconds"] for r in results),
+        "jobs_per_second": len(done) / wall if wall else 0.0,
+        "bits_per_second": bits / wall if wall else 0.0,
+        "cover_mb_per_second": cover_bytes / 1024 / 1024 / wall if wall else 0.0,
+    }
+    return results, summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Пакетное встраивание/извлечение без GUI")
+    parser.add_argument("manifest", help="CSV / JSON / JSONL со списком заданий")
+    parser.add_argument("-j", "--workers", type=int, default=os.cpu_count(), help="число процессов")
+    parser.add_argument("--report", help="сохранить результаты и сводку в JSON")
+    parser.add_argument("--phase-log", help="дописывать замеры фаз каждого задания в CSV или JSON Lines")
+    parser.add_argument("--phase-memory", action="store_true", help="писать в --phase-log и пик памяти (медленнее)")
+    parser.add_argument("--index", default=INDEX_FILE, help="индекс емкости для заданий с cover_dir")
+    args = parser.parse_args()
+
+    jobs = load_manifest(args.manifest)
+    assign_covers(jobs, args.index)
+
+    def show(r):
+        status = "OK " if r["ok"] else "ERR"
+        # method и cover берутся из манифеста как есть и могут отсутствовать
+        line = (f"[{status}] #{r['index']:<5} {r['action']:<8} {r['method'] or '-':<11} "
+                f"{r['seconds']:8.3f} сек  {r['cover'] or '-'}")
+        print(line if r["ok"] else f"{line}\n      {r['error']}")
+
+    results, summary = run_batch(jobs, args.workers, show, args.phase_log, args.phase_memory)
+
+    print(f"\nЗаданий: {summary['jobs']}, успешно: {summary['ok']}, ошибок: {summary['failed']}")
+    print(f"Время: {summary['wall_seconds']:.3f} сек (сумма по заданиям {summary['cpu_seconds']:.3f} сек)")
+    print(f"Пропускная способность: {summary['jobs_per_second']:.2f} заданий/сек, "
+          f"{summary['bits_per_second']:.0f} бит/сек, {summary['cover_mb_per_second']:.2f} МБ обложек/сек")
+
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump({"summary": summary, "results": results}, f, ensure_ascii=False, indent=2)
+
+    return 0 if summary["failed"] == 0 else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,363 @@
+import argparse
+import io
+import json
+import os
+import random
+import string
+import tempfile
+import time
+import tracemalloc
+import zipfile
+from xml.sax.saxutils import escape
+
+from bs4 import BeautifulSoup
+from docx import Document
+
+from steganograhpy import (DOCX_ENGINES, HTML_PARSERS, STEGO_METHODS, StegoSpacesDocx, StegoSpacesHTML,
+                           StegoZeroWidthDocx, StegoZeroWidthHTML, html_text_nodes, iter_html_chunk_segments,
+                           iter_html_segments, phases_ms, segment_text)
+
+
+WORDS = ["lorem", "ipsum", "dolor", "sit", "amet", "текст", "пример", "стеганография", "consectetur"]
+
+# Файл с результатами по умолчанию; его же читает панель статистики StegoApp
+BENCHMARK_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark.json")
+SUITE_SIZES_MB = [0.01, 0.1, 1, 10, 100]
+METHOD_LABELS = {"spaces": "Пробелы", "zero-width": "Zero-Width"}
+# Обрывки разметки для html-stream-check: лишние закрывающие теги, комментарии, сущности, пробелы
+HTML_FRAGMENTS = ["<div>", "</div>", "<p>", "</p>", "<b>", "</b>", "</i>", "<span class='x'>", "</span>",
+                  "<br>", "</br>", "<br/>", "<img src=a>", "<pre>", "</pre>", "<!-- c -->", "<!-->", "-->",
+                  "<script>var a=1</script>", "<style>p{}</style>", "<title>t</title>", "<!DOCTYPE html>",
+                  "</table>", "</html>", "&amp;", "&nbsp;", "&lt;", " ", "   ", "\n", " \t ", "alpha", "beta", "w"]
+
+
+def synthetic_paragraphs(size_mb: float, paragraph_kb: float, seed: int = 0):
+    """Абзацы случайных слов общим объемом ~size_mb (в UTF-8).
+
+    Возвращает список абзацев и емкость: пробелы, непробельные символы, все символы.
+    """
+    rnd = random.Random(seed)
+    target = int(size_mb * 1024 * 1024)
+    paragraphs = []
+    written = spaces = letters = chars = 0
+    while written < target:
+        words = []
+        length = 0
+        while length < paragraph_kb * 1024:
+            w = rnd.choice(WORDS)
+            words.append(w)
+            length += len(w) + 1
+        text = " ".join(words)
+        paragraphs.append(text)
+        spaces += len(words) - 1
+        letters += len(text) - (len(words) - 1)
+        chars += len(text)
+        written += len(text.encode("utf-8"))
+    return paragraphs, {"spaces": spaces, "letters": letters, "chars": chars}
+
+
+def make_html_cover(path: str, size_mb: float, paragraph_kb: float = 64, seed: int = 0):
+    """Синтетический HTML заданного размера; по умолчанию из крупных абзацев (длинные текстовые узлы).
+
+    Возвращает емкость обложки: число промежутков между словами и число букв.
+    """
+    paragraphs, capacity = synthetic_paragraphs(size_mb, paragraph_kb, seed)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("<html><head><title>cover</title><style>p { margin: 0 }</style></head><body>\n")
+        for text in paragraphs:
+            f.write("<p>" + text + "</p>\n")
+        f.write("<script>var x = 1;</script></body></html>\n")
+    return capacity["spaces"], capacity["letters"]
+
+
+def make_docx_cover(path: str, size_mb: float, paragraph_kb: float = 1, seed: int = 0):
+    """Синтетический DOCX: шаблон python-docx с подмененным word/document.xml.
+
+    Тело пишется напрямую, без объектной модели, поэтому большие обложки создаются быстро.
+    Возвращает емкость: число пробелов и число символов текста.
+    """
+    paragraphs, capacity = synthetic_paragraphs(size_mb, paragraph_kb, seed)
+    template = io.BytesIO()
+    Document().save(template)
+
+    with zipfile.ZipFile(template) as src, zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as dst:
+        for item in src.infolist():
+            if item.filename != "word/document.xml":
+                dst.writestr(item, src.read(item.filename))
+        with dst.open("word/document.xml", "w") as f:
+            f.write(b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+                    b'<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">'
+                    b'<w:body>')
+            for text in paragraphs:
+                f.write(f'<w:p><w:r><w:t xml:space="preserve">{escape(text)}</w:t></w:r></w:p>'.encode("utf-8"))
+            f.write(b"</w:body></w:document>")
+    return capacity["spaces"], capacity["chars"]
+
+
+def _measure(func, memory: bool):
+    """(результат, секунды, пик памяти в МБ или None). Время меряется без tracemalloc."""
+    t = time.perf_counter()
+    result = func()
+    seconds = time.perf_counter() - t
+    peak = None
+    if memory:
+        tracemalloc.start()
+        try:
+            func()
+            peak = tracemalloc.get_traced_memory()[1] / 1024 / 1024
+        finally:
+            tracemalloc.stop()
+    return result, seconds, peak
+
+
+def run_suite(sizes_mb=None, formats=("docx", "html"), methods=("spaces", "zero-width"),
+              fill: float = 0.5, memory: bool = True, progress=None, seed: int = 0):
+    """Embed + extract для всех STEGO_METHODS на синтетических обложках.
+
+    Секрет один для всех методов на данной обложке и занимает долю fill от емкости
+    самого "тесного" метода, так что бит/сек сравнимы между методами. Для каждого случая пишутся бит/сек,
+    пик памяти (tracemalloc, отдельным прогоном) и рост размера файла.
+    progress(done, total) вызывается после каждого случая.
+    """
+    sizes_mb = sizes_mb or SUITE_SIZES_MB
+    cases = [(fmt, method, size) for size in sizes_mb for fmt in formats for method in methods]
+    rnd = random.Random(seed)
+    results = []
+
+    with tempfile.TemporaryDirectory() as tmp:
+        covers = {}
+        for i, (fmt, method, size) in enumerate(cases):
+            if (fmt, size) not in covers:
+                cover = os.path.join(tmp, f"cover_{size}.{fmt}")
+                if fmt == "docx":
+                    spaces, letters = make_docx_cover(cover, size, seed=seed)
+                else:
+                    spaces, letters = make_html_cover(cover, size, paragraph_kb=1, seed=seed)
+                secret_len = max(1, int(min(spaces, letters) * fill) // 8 - 4)
+                secret = "".join(rnd.choices(string.ascii_letters + string.digits, k=secret_len))
+                covers[(fmt, size)] = (cover, secret)
+            cover, secret = covers[(fmt, size)]
+            output = os.path.join(tmp, f"stego.{fmt}")
+
+            stego = STEGO_METHODS[(fmt, method)]()
+            if hasattr(stego, "cover_cache"):
+                # Меряется разбор обложки при каждом вызове, а не повторное использование шаблона
+                stego.cover_cache = None
+
+            # Фазы берутся из первого прогона, пока tracemalloc выключен
+            ((_, bits), embed_timing), embed_s, embed_peak = _measure(
+                lambda: (stego.embed(cover, secret, "benchmark", output), stego.last_timing), memory)
+            ((message, _, _), extract_timing), extract_s, extract_peak = _measure(
+                lambda: (stego.extract(output, "benchmark"), stego.last_timing), memory)
+
+            cover_bytes = os.path.getsize(cover)
+            output_bytes = os.path.getsize(output)
+            results.append({
+                "format": fmt,
+                "method": method,
+                "size_mb": size,
+                "cover_bytes": cover_bytes,
+                "secret_bytes": len(secret),
+                "bits": bits,
+                "embed_seconds": embed_s,
+                "extract_seconds": extract_s,
+                "embed_bits_per_second": bits / embed_s if embed_s else 0.0,
+                "extract_bits_per_second": bits / extract_s if extract_s else 0.0,
+                "embed_peak_mb": embed_peak,
+                "extract_peak_mb": extract_peak,
+                "embed_phases_ms": phases_ms(embed_timing),
+                "extract_phases_ms": phases_ms(extract_timing),
+                "output_bytes": output_bytes,
+                "inflation": output_bytes / cover_bytes,
+                "ok": message == secret,
+            })
+            if progress:
+                progress(i + 1, len(cases))
+
+    return {
+        "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "fill": fill,
+        "results": results,
+        "summary": summarize(results),
+    }
+
+
+def summarize(results):
+    """Во сколько раз "Пробелы" быстрее "Zero-Width" на самом большом общем размере обложки."""
+    summary = {}
+    for fmt in ("docx", "html"):
+        rows = {(r["method"], r["size_mb"]): r for r in results if r["format"] == fmt}
+        sizes = sorted(size for method, size in rows if method == "spaces" and ("zero-width", size) in rows)
+        if not sizes:
+            continue
+        spaces, zero = rows[("spaces", sizes[-1])], rows[("zero-width", sizes[-1])]
+        summary[fmt] = {
+            "size_mb": sizes[-1],
+            "embed_ratio": spaces["embed_bits_per_second"] / zero["embed_bits_per_second"],
+            "extract_ratio": spaces["extract_bits_per_second"] / zero["extract_bits_per_second"],
+            "spaces_inflation": spaces["inflation"],
+            "zero_width_inflation": zero["inflation"],
+        }
+    return summary
+
+
+def describe_ratio(ratio: float) -> str:
+    if ratio >= 1:
+        return f"Пробелы быстрее Zero-Width в {ratio:.2f} раза"
+    return f"Zero-Width быстрее Пробелов в {1 / ratio:.2f} раза"
+
+
+def load_results(path: str = BENCHMARK_FILE):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def save_results(report, path: str = BENCHMARK_FILE):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+def bench_html_scaling(sizes_mb, repeats: int = 1, parser: str = "html.parser"):
+    """Время embed для обоих HTML-методов на обложках разного размера.
+
+    Секрет подбирается под ~90% емкости обложки, поэтому переписываются почти все
+    текстовые узлы; при линейной сложности колонка "сек/МБ" остается примерно постоянной.
+    """
+    methods = {"Пробелы": StegoSpacesHTML(parser=parser), "Zero-Width": StegoZeroWidthHTML(parser=parser)}
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in sizes_mb:
+            cover = os.path.join(tmp, f"cover_{size}.html")
+            output = os.path.join(tmp, "stego.html")
+            gaps, letters = make_html_cover(cover, size)
+            capacity = {"Пробелы": gaps, "Zero-Width": letters}
+
+            for name, method in methods.items():
+                secret = "s" * (capacity[name] * 9 // 10 // 8 - 4)
+                best = None
+                for _ in range(repeats):
+                    t = time.perf_counter()
+                    method.embed(cover, secret, "benchmark", output)
+                    t = time.perf_counter() - t
+                    best = t if best is None else min(best, t)
+                rows.append((name, size, best, best / size))
+    return rows
+
+
+def bench_docx_engines(sizes_mb, fill: float = 0.5):
+    """embed/extract обоих DOCX-методов на движках DOCX_ENGINES: (метод, движок, МБ, embed сек, extract сек).
+
+    Кэш обложек выключен, так что "python-docx" каждый раз разбирает документ заново.
+    """
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in sizes_mb:
+            cover = os.path.join(tmp, f"cover_{size}.docx")
+            output = os.path.join(tmp, "stego.docx")
+            spaces, chars = make_docx_cover(cover, size)
+            capacity = {"Пробелы": spaces, "Zero-Width": chars}
+            for name, cls in (("Пробелы", StegoSpacesDocx), ("Zero-Width", StegoZeroWidthDocx)):
+                secret = "s" * max(1, int(capacity[name] * fill) // 8 - 4)
+                for engine in DOCX_ENGINES:
+                    method = cls(engine=engine)
+                    method.cover_cache = None
+                    embed_s, _ = method.embed(cover, secret, "benchmark", output)
+                    _, extract_s, _ = method.extract(output, "benchmark")
+                    rows.append((name, engine, size, embed_s, extract_s))
+    return rows
+
+
+def check_html_stream(pages: int = 3000, seed: int = 0, max_chunk: int = 12):
+    """Сверяет потоковый обход HTML с BeautifulSoup("html.parser") на случайных страницах.
+
+    Видимый текст iter_html_segments должен совпасть с html_text_nodes, а разбор кусками
+    (от 1 до max_chunk символов) - дать те же raw и тот же текст. Возвращает страницы с расхождениями.
+    """
+    rnd = random.Random(seed)
+    bad = []
+    for _ in range(pages):
+        page = "".join(rnd.choice(HTML_FRAGMENTS) for _ in range(rnd.randint(1, 40)))
+        expected = "".join(html_text_nodes(BeautifulSoup(page, "html.parser")))
+        segments = list(iter_html_segments(page))
+        text = "".join(segment_text(raw, visible) for raw, visible in segments if visible)
+        # Незакрытый "<!--" html.parser разбирает по-разному в разных версиях Python,
+        # а поток считает комментарием все до конца: сравнивается только текст до него (без пробелов
+        # перед ним - в html.parser они склеиваются с текстом комментария)
+        open_comment = any(raw.startswith("<!--") and not raw[4:].endswith("-->") for raw, _ in segments)
+        k = rnd.randint(1, max_chunk)
+        chunked = list(iter_html_chunk_segments(page[i:i + k] for i in range(0, len(page), k)))
+        chunked_text = "".join(segment_text(raw, visible) for raw, visible in chunked if visible)
+        if (not expected.startswith(text.rstrip()) if open_comment else text != expected) \
+                or "".join(raw for raw, _ in chunked) != page or chunked_text != text:
+            bad.append(page)
+    return bad
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарки стеганографии")
+    sub = parser.add_subparsers(dest="command")
+
+    suite = sub.add_parser("suite", help="embed/extract всех методов на DOCX и HTML (по умолчанию)")
+    suite.add_argument("--sizes", type=float, nargs="+", default=SUITE_SIZES_MB, help="размеры обложек, МБ")
+    suite.add_argument("--fill", type=float, default=0.5, help="доля емкости обложки под секрет")
+    suite.add_argument("--no-memory", action="store_true", help="не замерять пик памяти (вдвое быстрее)")
+    suite.add_argument("--output", default=BENCHMARK_FILE, help="куда сохранить JSON")
+
+    scaling = sub.add_parser("html-scaling", help="линейность embed на больших HTML-узлах")
+    scaling.add_argument("--sizes", type=float, nargs="+", default=[1, 2, 5, 10], help="размеры обложек, МБ")
+    scaling.add_argument("--repeats", type=int, default=1)
+    scaling.add_argument("--parser", choices=HTML_PARSERS, default="html.parser")
+
+    engines = sub.add_parser("docx-engines", help="python-docx против потокового движка OOXML")
+    engines.add_argument("--sizes", type=float, nargs="+", default=[1, 10, 50], help="размеры обложек, МБ")
+    engines.add_argument("--fill", type=float, default=0.5, help="доля емкости обложки под секрет")
+
+    check = sub.add_parser("html-stream-check", help="сверка парсера stream с BeautifulSoup на случайных страницах")
+    check.add_argument("--pages", type=int, default=3000)
+    check.add_argument("--seed", type=int, default=0)
+
+    args = parser.parse_args()
+
+    if args.command == "html-stream-check":
+        bad = check_html_stream(args.pages, args.seed)
+        for page in bad[:5]:
+            print(repr(page))
+        print(f"Расхождений: {len(bad)} из {args.pages}")
+        return
+
+    if args.command == "docx-engines":
+        print(f"{'Метод':<12}{'Движок':<13}{'МБ':>8}{'embed сек':>11}{'extract сек':>13}")
+        for name, engine, size, embed_s, extract_s in bench_docx_engines(args.sizes, args.fill):
+            print(f"{name:<12}{engine:<13}{size:>8g}{embed_s:>11.3f}{extract_s:>13.3f}")
+        return
+
+    if args.command == "html-scaling":
+        print(f"{'Метод':<12}{'МБ':>8}{'сек':>10}{'сек/МБ':>10}")
+        for name, size, seconds, per_mb in bench_html_scaling(args.sizes, args.repeats, args.parser):
+            print(f"{name:<12}{size:>8g}{seconds:>10.3f}{per_mb:>10.3f}")
+        return
+
+    if args.command is None:
+        args = suite.parse_args([])
+
+    report = run_suite(args.sizes, fill=args.fill, memory=not args.no_memory,
+                       progress=lambda done, total: print(f"[{done}/{total}]", end="\r", flush=True))
+    save_results(report, args.output)
+
+    print(f"{'Формат':<7}{'Метод':<12}{'МБ':>8}{'embed бит/с':>14}{'extract бит/с':>15}"
+          f"{'пик МБ':>9}{'рост':>7}{'OK':>5}")
+    for r in report["results"]:
+        peak = "-" if r["embed_peak_mb"] is None else f"{max(r['embed_peak_mb'], r['extract_peak_mb']):.1f}"
+        print(f"{r['format']:<7}{METHOD_LABELS[r['method']]:<12}{r['size_mb']:>8g}"
+              f"{r['embed_bits_per_second']:>14.0f}{r['extract_bits_per_second']:>15.0f}"
+              f"{peak:>9}{r['inflation']:>7.2f}{'да' if r['ok'] else 'нет':>5}")
+    for fmt, s in report["summary"].items():
+        print(f"{fmt.upper()}: {describe_ratio(s['embed_ratio'])} (embed, {s['size_mb']:g} МБ)")
+    print(f"Результаты: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+import argparse
+import hashlib
+import json
+import os
+
+from docx import Document
+
+from steganograhpy import (HTML_PARSERS, ZW_BITS_PER_MARKER, _ZW_STRIP, count_letters, docx_text_elements,
+                           file_format, iter_html_visible_text, iter_pdf_pages_text, read_html_file)
+
+
+# Индекс по умолчанию лежит рядом со скриптом, как и benchmark.json
+INDEX_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "capacity_index.json")
+COVER_EXTENSIONS = (".docx", ".html", ".htm", ".pdf")
+HEADER_BYTES = 4  # заголовок длины перед сообщением
+HASH_CHUNK = 1 << 20
+# Меняется вместе с правилами подсчета в analyze_cover: емкости из старого индекса пересчитываются
+INDEX_VERSION = 2
+
+
+def file_hash(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_CHUNK), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def analyze_cover(path: str, parser: str = "html.parser") -> dict:
+    """Число позиций для обоих методов за один проход по тексту обложки.
+
+    Позиции считаются так же, как их занимает embed: для "Пробелов" - обычные пробелы
+    (в DOCX внутри <w:t>, в HTML - в видимых узлах), для Zero-Width - все символы <w:t>
+    в DOCX и непробельные символы видимых узлов в HTML. PDF считается как HTML, по тексту страниц.
+    Уже стоящие zero-width маркеры embed удаляет перед встраиванием, поэтому они не считаются.
+    """
+    fmt = file_format(path)
+    spaces = zero_width = 0
+    if fmt == "docx":
+        for t in docx_text_elements(Document(path)):
+            spaces += t.text.count(" ")
+            zero_width += len(t.text.translate(_ZW_STRIP))
+    else:
+        texts = iter_pdf_pages_text(path) if fmt == "pdf" else iter_html_visible_text(read_html_file(path), parser)
+        for text in texts:
+            spaces += text.count(" ")
+            zero_width += count_letters(text.translate(_ZW_STRIP))
+    return {"format": fmt, "spaces": spaces, "zero-width": zero_width}
+
+
+def capacity_bytes(entry: dict, method: str, bits_per_marker: int = 1) -> int:
+    """Наибольшая длина сообщения в байтах UTF-8 (без учета сжатия), которая поместится в обложку."""
+    slots = entry[method]
+    if method == "zero-width":
+        if bits_per_marker not in ZW_BITS_PER_MARKER:
+            raise ValueError(f"Неподдерживаемое число бит на маркер: {bits_per_marker}")
+        if bits_per_marker > 1:
+            # Один маркер уходит на метку алфавита
+            slots = max(0, slots - 1) * bits_per_marker
+    return max(0, slots // 8 - HEADER_BYTES)
+
+
+def iter_covers(paths):
+    # Файлы берутся как есть, папки обходятся рекурсивно по COVER_EXTENSIONS
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, names in os.walk(path):
+                for name in sorted(names):
+                    if name.lower().endswith(COVER_EXTENSIONS):
+                        yield os.path.join(root, name)
+        else:
+            yield path
+
+
+class CapacityIndex:
+    """Кэш анализа обложек на диске.
+
+    files: путь -> mtime, размер и sha256 файла; covers: sha256 (+ парсер для HTML) -> емкость.
+    Пока mtime и размер не изменились, файл вообще не читается; иначе пересчитывается хеш,
+    и разбор повторяется, только если изменилось содержимое. Копии одного файла разбираются один раз.
+    """
+
+    def __init__(self, path: str = INDEX_FILE, parser: str = "html.parser"):
+        self.path = path
+        self.parser = parser
+        self.files = {}
+        self.covers = {}
+        self.dirty = False
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            self.files = data.get("files", {})
+            if data.get("version") == INDEX_VERSION:
+                self.covers = data.get("covers", {})
+        except (OSError, ValueError):
+            pass
+
+    def lookup(self, cover: str) -> dict:
+        cover = os.path.abspath(cover)
+        st = os.stat(cover)
+        known = self.files.get(cover)
+        if known and known["mtime"] == st.st_mtime_ns and known["size"] == st.st_size:
+            digest = known["sha256"]
+        else:
+            digest = file_hash(cover)
+            self.files[cover] = {"mtime": st.st_mtime_ns, "size": st.st_size, "sha256": digest}
+            self.dirty = True
+
+        fmt = file_format(cover)
+        key = f"{digest}:{self.parser}" if fmt == "html" else digest
+        if key not in self.covers:
+            self.covers[key] = analyze_cover(cover, self.parser)
+            self.dirty = True
+        return self.covers[key]
+
+    def scan(self, paths, progress=None):
+        """Емкость всех обложек из paths; возвращает (путь -> емкость, путь -> ошибка)."""
+        covers = list(iter_covers(paths))
+        entries, errors = {}, {}
+        for i, cover in enumerate(covers):
+            try:
+                entries[cover] = self.lookup(cover)
+            except Exception as e:
+                errors[cover] = f"{type(e).__name__}: {e}"
+            if progress:
+                progress(i + 1, len(covers))
+        return entries, errors
+
+    def pick(self, paths, message_bytes: int, method: str, bits_per_marker: int = 1, fmt: str = None):
+        """Самая "тесная" обложка, в которую помещается сообщение, или None.
+
+        Меньшая подходящая обложка оставляет большие для длинных сообщений.
+        """
+        entries, _ = self.scan(paths)
+        fitting = [(capacity_bytes(entry, method, bits_per_marker), cover)
+                   for cover, entry in entries.items()
+                   if fmt in (None, entry["format"])]
+        fitting = [(cap, cover) for cap, cover in fitting if cap >= message_bytes]
+        return min(fitting)[1] if fitting else None
+
+    def save(self):
+        if not self.dirty:
+            return
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"version": INDEX_VERSION, "files": self.files, "covers": self.covers}, f, ensure_ascii=False)
+        os.replace(tmp, self.path)
+        self.dirty = False
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Емкость обложек DOCX/HTML/PDF с кэшем на диске")
+    parser.add_argument("--index", default=INDEX_FILE, help="файл индекса")
+    parser.add_argument("--parser", choices=HTML_PARSERS, default="html.parser")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    scan = sub.add_parser("scan", help="емкость файлов и папок")
+    scan.add_argument("paths", nargs="+")
+    scan.add_argument("--bits-per-marker", type=int, default=1, choices=ZW_BITS_PER_MARKER)
+
+    pick = sub.add_parser("pick", help="подобрать обложку под сообщение")
+    pick.add_argument("paths", nargs="+")
+    pick.add_argument("--method", choices=("spaces", "zero-width"), required=True)
+    pick.add_argument("--bytes", type=int, required=True, help="длина сообщения в байтах UTF-8")
+    pick.add_argument("--bits-per-marker", type=int, default=1, choices=ZW_BITS_PER_MARKER)
+    pick.add_argument("--format", choices=("docx", "html", "pdf"))
+
+    args = parser.parse_args()
+    index = CapacityIndex(args.index, args.parser)
+    try:
+        if args.command == "scan":
+            entries, errors = index.scan(args.paths)
+            print(f"{'Пробелы, байт':>14}{'Zero-Width, байт':>18}  Файл")
+            for cover, entry in entries.items():
+                print(f"{capacity_bytes(entry, 'spaces'):>14}"
+                      f"{capacity_bytes(entry, 'zero-width', args.bits_per_marker):>18}  {cover}")
+            for cover, error in errors.items():
+                print(f"{'ERR':>14}{'':>18}  {cover}\n      {error}")
+            return 0
+
+        cover = index.pick(args.paths, args.bytes, args.method, args.bits_per_marker, args.format)
+        if cover is None:
+            print("Подходящей обложки нет")
+            return 1
+        print(cover)
+        return 0
+    finally:
+        index.save()
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
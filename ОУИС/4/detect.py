@@ -0,0 +1,184 @@
+import argparse
+import csv
+import json
+import math
+import os
+import re
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+
+from steganograhpy import ZW_ALPHABET
+
+
+# Маркеры ищутся прямо в байтах UTF-8, без декодирования и разбора документа
+NNBSP = "\u202F".encode("utf-8")
+ZW_BYTES = tuple(m.encode("utf-8") for m in ZW_ALPHABET)
+# Все маркеры начинаются с E2 80 или E2 81: блоки без этих пар дальше не проверяются
+_LEADS = (b"\xe2\x80", b"\xe2\x81")
+# U+202F перед ; : ! ? » - обычная французская типографика, а не канал
+_TYPOGRAPHIC = re.compile(re.escape(NNBSP) + rb"(?:[;:!?]|\xc2\xbb)")
+_TAIL = 4  # хватает, чтобы не потерять маркер (3 байта) или типографскую пару (до 5) на стыке блоков
+
+DOCX_PARTS = re.compile(r"word/(?:document|header\d*|footer\d*|footnotes|endnotes|comments)\.xml")
+SCAN_EXTENSIONS = (".docx", ".html", ".htm")
+SCAN_CHUNK = 1 << 20
+MIN_MARKERS = 256  # с такого числа маркеров счет считается полным
+REPORT_COLUMNS = ("score", "channel", "path", "format", "bytes", "spaces", "nnbsp", "nnbsp_typographic",
+                  "zero_width", "zw_kinds", "zw_entropy", "error")
+
+
+class MarkerCounter:
+    """Счетчики маркеров по потоку байт; блоки подаются через feed в любом размере."""
+
+    def __init__(self):
+        self.bytes = 0
+        self.spaces = 0
+        self.nnbsp = 0
+        self.typographic = 0
+        self.zero_width = [0] * len(ZW_BYTES)
+        self._tail = b""
+
+    def feed(self, chunk: bytes):
+        self.bytes += len(chunk)
+        self.spaces += chunk.count(b" ")
+        window = self._tail + chunk
+        tail = self._tail
+        self._tail = window[-_TAIL:]
+        if not any(lead in window for lead in _LEADS):
+            return
+        # Совпадения целиком внутри хвоста уже посчитаны на прошлом блоке
+        self.nnbsp += window.count(NNBSP) - tail.count(NNBSP)
+        self.typographic += len(_TYPOGRAPHIC.findall(window)) - len(_TYPOGRAPHIC.findall(tail))
+        for i, marker in enumerate(ZW_BYTES):
+            self.zero_width[i] += window.count(marker) - tail.count(marker)
+
+
+def iter_file_chunks(path: str, chunk: int = SCAN_CHUNK):
+    # HTML читается как есть; в DOCX распаковываются только части с текстом
+    if path.lower().endswith(".docx"):
+        with zipfile.ZipFile(path) as z:
+            for name in z.namelist():
+                if DOCX_PARTS.fullmatch(name):
+                    with z.open(name) as f:
+                        yield from iter(lambda: f.read(chunk), b"")
+    else:
+        with open(path, "rb") as f:
+            yield from iter(lambda: f.read(chunk), b"")
+
+
+def entropy(counts) -> float:
+    total = sum(counts)
+    return -sum(c / total * math.log2(c / total) for c in counts if c) if total else 0.0
+
+
+def score_counts(counter: MarkerCounter):
+    """(оценка 0..1, канал) по счетчикам файла.
+
+    Пробелы: U+202F вне типографских позиций; Zero-Width: число маркеров, умноженное на энтропию
+    их распределения - зашифрованные биты дают смесь разных маркеров, а естественный текст
+    (ZWJ в эмодзи, ZWNJ в персидском) - в основном один и тот же символ.
+    """
+    spaces_score = min(1.0, (counter.nnbsp - counter.typographic) / MIN_MARKERS)
+    zw_total = sum(counter.zero_width)
+    zw_score = min(1.0, zw_total / MIN_MARKERS) * min(1.0, entropy(counter.zero_width))
+    if max(spaces_score, zw_score) <= 0:
+        return 0.0, ""
+    return (spaces_score, "spaces") if spaces_score >= zw_score else (zw_score, "zero-width")
+
+
+def scan_file(path: str) -> dict:
+    result = {"path": path, "format": os.path.splitext(path)[1].lower().lstrip("."), "error": None}
+    counter = MarkerCounter()
+    try:
+        for chunk in iter_file_chunks(path):
+            counter.feed(chunk)
+    except (OSError, zipfile.BadZipFile) as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    score, channel = score_counts(counter)
+    result.update({
+        "score": round(score, 4),
+        "channel": channel,
+        "bytes": counter.bytes,
+        "spaces": counter.spaces,
+        "nnbsp": counter.nnbsp,
+        "nnbsp_typographic": counter.typographic,
+        "zero_width": sum(counter.zero_width),
+        "zw_kinds": sum(1 for c in counter.zero_width if c),
+        "zw_entropy": round(entropy(counter.zero_width), 4),
+    })
+    return result
+
+
+def iter_scan_paths(paths):
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, names in os.walk(path):
+                for name in names:
+                    if name.lower().endswith(SCAN_EXTENSIONS):
+                        yield os.path.join(root, name)
+        else:
+            yield path
+
+
+def scan(paths, workers: int = None, chunksize: int = 64, progress=None):
+    """Сканирует файлы в пуле процессов; возвращает (результаты по убыванию оценки, сводка)."""
+    files = list(iter_scan_paths(paths))
+    start = time.perf_counter()
+    results = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for i, result in enumerate(pool.map(scan_file, files, chunksize=chunksize)):
+            results.append(result)
+            if progress:
+                progress(i + 1, len(files))
+    wall = time.perf_counter() - start
+
+    results.sort(key=lambda r: (-r["score"], -r["nnbsp"] - r["zero_width"], r["path"]))
+    summary = {
+        "files": len(results),
+        "flagged": sum(1 for r in results if r["score"] > 0),
+        "errors": sum(1 for r in results if r["error"]),
+        "wall_seconds": wall,
+        "files_per_hour": len(results) / wall * 3600 if wall else 0.0,
+        "mb_per_second": sum(r["bytes"] for r in results) / 1024 / 1024 / wall if wall else 0.0,
+    }
+    return results, summary
+
+
+def save_report(results, summary, path: str):
+    if path.lower().endswith(".csv"):
+        with open(path, "w", encoding="utf-8", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=REPORT_COLUMNS)
+            writer.writeheader()
+            writer.writerows(results)
+    else:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"summary": summary, "results": results}, f, ensure_ascii=False, indent=2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Поиск скрытых каналов (U+202F, zero-width) без ключа")
+    parser.add_argument("paths", nargs="+", help="файлы и папки с DOCX/HTML")
+    parser.add_argument("-j", "--workers", type=int, default=os.cpu_count(), help="число процессов")
+    parser.add_argument("--report", help="сохранить полный отчет (CSV или JSON)")
+    parser.add_argument("--top", type=int, default=20, help="сколько файлов показать")
+    args = parser.parse_args()
+
+    results, summary = scan(args.paths, args.workers)
+    if args.report:
+        save_report(results, summary, args.report)
+
+    print(f"{'Оценка':>7} {'Канал':<11}{'202F':>8}{'ZW':>9}{'Энтр.':>7}  Файл")
+    for r in results[:args.top]:
+        if r["score"] <= 0:
+            break
+        print(f"{r['score']:>7.3f} {r['channel']:<11}{r['nnbsp']:>8}{r['zero_width']:>9}"
+              f"{r['zw_entropy']:>7.2f}  {r['path']}")
+    print(f"\nФайлов: {summary['files']}, подозрительных: {summary['flagged']}, ошибок: {summary['errors']}")
+    print(f"Время: {summary['wall_seconds']:.2f} сек ({summary['files_per_hour']:.0f} файлов/час, "
+          f"{summary['mb_per_second']:.1f} МБ/сек)")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,229 @@
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from capacity import INDEX_FILE, CapacityIndex, capacity_bytes
+from steganograhpy import build_payload, bytes_to_bits, file_format, read_payload, secret_bytes, stego_method
+
+
+# Заголовок каждой части: идентификатор сообщения (4 байта), номер части и число частей (по 2 байта)
+SHARD_HEADER_BYTES = 8
+MAX_SHARDS = 0xFFFF
+# Внешнее шифрование идет на производном ключе, чтобы его гамма не совпадала с гаммой частей
+SHARD_KEY_SUFFIX = "/shards"
+
+
+def split_sizes(total: int, capacities):
+    """Делит total байт между обложками пропорционально их емкости."""
+    room = sum(capacities)
+    if total > room:
+        raise ValueError(f"Недостаточно емкости обложек: нужно {total} байт, есть {room}")
+    sizes = [min(cap, -(-total * cap // room)) for cap in capacities]
+    excess = sum(sizes) - total
+    for i in reversed(range(len(sizes))):
+        cut = min(excess, sizes[i])
+        sizes[i] -= cut
+        excess -= cut
+    return sizes
+
+
+def shard_output(out_dir: str, index: int, cover: str) -> str:
+    # Номер в имени защищает от совпадения имен обложек из разных папок
+    return os.path.join(out_dir, f"{index:03d}_{os.path.basename(cover)}")
+
+
+def _embed_shard(task: dict) -> dict:
+    start = time.perf_counter()
+    method = stego_method(task["cover"], task["method"], **task["options"])
+    _, bits = method.embed(task["cover"], task["data"], task["key"], task["output"])
+    return {"index": task["index"], "cover": task["cover"], "output": task["output"],
+            "bytes": len(task["data"]), "bits": bits, "seconds": time.perf_counter() - start}
+
+
+def _extract_shard(task: dict) -> dict:
+    start = time.perf_counter()
+    result = {"file": task["file"], "error": None}
+    try:
+        method = stego_method(task["file"], task["method"], **task["options"])
+        data, _, _ = method.extract_bytes(task["file"], task["key"])
+        if len(data) < SHARD_HEADER_BYTES:
+            raise ValueError("Файл не содержит части сообщения")
+        result["payload_id"] = data[:4].hex()
+        result["index"] = int.from_bytes(data[4:6], "big")
+        result["count"] = int.from_bytes(data[6:8], "big")
+        result["data"] = data[SHARD_HEADER_BYTES:]
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    result["seconds"] = time.perf_counter() - start
+    return result
+
+
+def embed_shards(covers, secret, key: str, out_dir: str, method: str, options: dict = None,
+                 compression: str = "none", workers: int = None, index_path: str = INDEX_FILE):
+    """Шифрует сообщение целиком, режет на части по емкости обложек и встраивает их параллельно.
+
+    options - параметры конструктора класса (keystream_mode, parser, bits_per_marker).
+    Обложки, в которые не помещается даже заголовок части, пропускаются (они в сводке, "skipped").
+    Если не встроилась хотя бы одна часть, уже записанные части удаляются.
+    Возвращает (части по порядку, сводка).
+    """
+    options = dict(options or {})
+    covers = list(covers)
+    if not 0 < len(covers) <= MAX_SHARDS:
+        raise ValueError(f"Число обложек должно быть от 1 до {MAX_SHARDS}")
+    mode = options.get("keystream_mode", "sha256")
+    cipher = build_payload(secret_bytes(secret), key + SHARD_KEY_SUFFIX, mode, compression)
+
+    index = CapacityIndex(index_path, options.get("parser", "html.parser"))
+    try:
+        bits_per_marker = int(options.get("bits_per_marker") or 1)
+        capacities = [capacity_bytes(index.lookup(c), method, bits_per_marker) - SHARD_HEADER_BYTES
+                      for c in covers]
+    finally:
+        index.save()
+    # Число частей в заголовке - только по обложкам, которые получат часть
+    skipped = [c for c, cap in zip(covers, capacities) if cap <= 0]
+    covers, capacities = [c for c, cap in zip(covers, capacities) if cap > 0], [cap for cap in capacities if cap > 0]
+
+    payload_id = os.urandom(4)
+    tasks = []
+    offset = 0
+    for i, (cover, size) in enumerate(zip(covers, split_sizes(len(cipher), capacities))):
+        header = payload_id + i.to_bytes(2, "big") + len(covers).to_bytes(2, "big")
+        tasks.append({"index": i, "cover": cover, "output": shard_output(out_dir, i, cover), "method": method,
+                      "options": options, "key": key, "data": header + cipher[offset:offset + size]})
+        offset += size
+
+    os.makedirs(out_dir, exist_ok=True)
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(_embed_shard, task) for task in tasks]
+    wall = time.perf_counter() - start
+
+    shards, errors = [], []
+    for future in futures:
+        try:
+            shards.append(future.result())
+        except Exception as e:
+            errors.append(e)
+    if errors:
+        # Неполный набор частей не собрать - записанные части не оставляются
+        for s in shards:
+            if os.path.exists(s["output"]):
+                os.remove(s["output"])
+        raise errors[0]
+
+    summary = {
+        "shards": len(shards),
+        "skipped": skipped,
+        "payload_bytes": len(cipher),
+        "wall_seconds": wall,
+        "cpu_seconds": sum(s["seconds"] for s in shards),
+        "bits_per_second": sum(s["bits"] for s in shards) / wall if wall else 0.0,
+    }
+    return shards, summary
+
+
+def extract_shards(files, key: str, method: str, options: dict = None, workers: int = None):
+    """Извлекает части из файлов в любом порядке и собирает сообщение.
+
+    Файлы без частей (другой ключ, чужие файлы) пропускаются. Возвращает (байты сообщения, отчет по файлам).
+    """
+    options = dict(options or {})
+    tasks = [{"file": f, "method": method, "options": options, "key": key} for f in files]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        report = list(pool.map(_extract_shard, tasks))
+
+    groups = {}
+    for r in report:
+        if r["error"] is None:
+            groups.setdefault((r["payload_id"], r["count"]), {})[r["index"]] = r["data"]
+
+    complete = [(count, parts) for (_, count), parts in groups.items() if len(parts) == count]
+    if not complete:
+        missing = {pid: sorted(set(range(count)) - set(parts)) for (pid, count), parts in groups.items()}
+        raise ValueError(f"Собраны не все части: недостает {missing}" if missing else "Части сообщения не найдены")
+    if len(complete) > 1:
+        raise ValueError("Среди файлов несколько полных сообщений")
+
+    count, parts = complete[0]
+    cipher = b"".join(parts[i] for i in range(count))
+    message, _ = read_payload([bytes_to_bits(cipher)], key + SHARD_KEY_SUFFIX,
+                              options.get("keystream_mode", "sha256"))
+    return message, report
+
+
+def _embed_command(args, options):
+    with open(args.secret_file, "r", encoding="utf-8") as f:
+        secret = f.read()
+    shards, summary = embed_shards(args.covers, secret, args.key, args.out_dir, args.method, options,
+                                   args.compression, args.workers)
+    for s in shards:
+        print(f"#{s['index']:<4} {s['bytes']:>10} байт {s['seconds']:8.3f} сек  {s['output']}")
+    for cover in summary["skipped"]:
+        print(f"[пропущена] {cover}: нет емкости")
+    print(f"\nЧастей: {summary['shards']}, нагрузка {summary['payload_bytes']} байт, "
+          f"время {summary['wall_seconds']:.3f} сек (сумма {summary['cpu_seconds']:.3f} сек)")
+    return 0
+
+
+def _extract_command(args, options):
+    files = [f for f in args.files if _known_format(f)]
+    message, report = extract_shards(files, args.key, args.method, options, args.workers)
+    for r in report:
+        if r["error"]:
+            print(f"[пропущен] {r['file']}: {r['error']}")
+    text = message.decode("utf-8")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        print(text)
+    return 0
+
+
+def _known_format(path: str) -> bool:
+    try:
+        file_format(path)
+        return True
+    except ValueError:
+        return False
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Сообщение, разбитое на части по нескольким обложкам")
+    parser.add_argument("--method", choices=("spaces", "zero-width"), required=True)
+    parser.add_argument("--key", required=True)
+    parser.add_argument("--keystream-mode", default="sha256")
+    parser.add_argument("--parser", default="html.parser")
+    parser.add_argument("--bits-per-marker", type=int, default=1)
+    parser.add_argument("-j", "--workers", type=int, default=os.cpu_count(), help="число процессов")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    embed = sub.add_parser("embed", help="встроить сообщение в несколько обложек")
+    embed.add_argument("covers", nargs="+")
+    embed.add_argument("--secret-file", required=True)
+    embed.add_argument("--out-dir", required=True)
+    embed.add_argument("--compression", default="none")
+
+    extract = sub.add_parser("extract", help="собрать сообщение из стего-файлов (в любом порядке)")
+    extract.add_argument("files", nargs="+")
+    extract.add_argument("--output", help="куда сохранить сообщение (по умолчанию - вывод на экран)")
+
+    args = parser.parse_args()
+    options = {"keystream_mode": args.keystream_mode, "parser": args.parser}
+    if args.method == "zero-width":
+        options["bits_per_marker"] = args.bits_per_marker
+
+    try:
+        if args.command == "embed":
+            return _embed_command(args, options)
+        return _extract_command(args, options)
+    except ValueError as e:
+        print(f"Ошибка: {e}")
+        return 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
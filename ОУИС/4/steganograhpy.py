@@ -1,12 +1,36 @@
+import bz2
+import codecs
+import contextlib
+import csv
+import functools
 import hashlib
+import html
+import json
+import lzma
+import mmap
 import os
+import re
+import shutil
+import sys
+import threading
 import time
+import tracemalloc
+import zipfile
+import zlib
+from collections import OrderedDict
+from xml.etree import ElementTree
+from xml.sax.saxutils import escape as xml_escape
+import numpy as np
 from docx import Document
 from docx.shared import RGBColor
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
 from bs4 import BeautifulSoup
+from bs4.element import PreformattedString
 import PyPDF2
+import reportlab
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
 from reportlab.pdfgen import canvas
 from reportlab.lib.pagesizes import letter
 from reportlab.lib.colors import black
@@ -14,341 +38,2082 @@ import io
 
 
 # ---------- Утилиты ----------
-def keystream_bytes(key: bytes, length: int) -> bytes:
-    out = bytearray()
-    counter = 0
-    while len(out) < length:
-        counter_bytes = counter.to_bytes(8, "big")
-        out.extend(hashlib.sha256(key + counter_bytes).digest())
-        counter += 1
-    return bytes(out[:length])
-
-
-def bytes_to_bits(b: bytes):
-    bits = []
-    for byte in b:
-        for i in range(7, -1, -1):
-            bits.append((byte >> i) & 1)
-    return bits
-
-
-def bits_to_bytes(bits):
-    if len(bits) % 8 != 0:
-        bits += [0] * (8 - len(bits) % 8)
-    out = bytearray()
-    for i in range(0, len(bits), 8):
-        byte = 0
-        for j in range(8):
-            byte = (byte << 1) | (bits[i + j] & 1)
-        out.append(byte)
-    return bytes(out)
+class StegoCancelled(Exception):
+    """Бросается из progress-колбэка, чтобы прервать embed/extract."""
+
+
+# ---------- Замеры по фазам ----------
+PHASES = ("parse", "payload", "keystream", "bitpack", "rewrite", "serialize")
+PHASE_LABELS = {"parse": "разбор", "payload": "нагрузка", "keystream": "гамма", "bitpack": "биты",
+                "rewrite": "перезапись", "serialize": "запись"}
+_phase_hooks = []
+
+
+def add_phase_hook(hook, memory: bool = False):
+    """Подписывает hook(record) на замеры всех embed/extract (запись - см. PhaseTimer.finish).
+
+    memory=True включает tracemalloc и пик памяти по фазам; операции при этом заметно медленнее.
+    """
+    _phase_hooks.append((hook, memory))
+
+
+def remove_phase_hook(hook):
+    _phase_hooks[:] = [(h, memory) for h, memory in _phase_hooks if h is not hook]
+
+
+class PhaseTimer:
+    """Время фаз одной операции по perf_counter_ns.
+
+    Фазы могут вкладываться: время вложенной не засчитывается внешней, так что сумма фаз
+    не больше общего времени. Пик памяти пишется, только если его запросил какой-нибудь хук.
+    Используется как контекстный менеджер: при ошибке внутри операции tracemalloc все равно
+    выключается, а запись хукам не отдается.
+    """
+
+    def __init__(self, operation: str, method, path: str):
+        self.operation = operation
+        self.method = type(method).__name__
+        self.path = path
+        self.phases = dict.fromkeys(PHASES, 0)
+        self.memory = any(memory for _, memory in _phase_hooks)
+        self.peaks = dict.fromkeys(PHASES, 0) if self.memory else None
+        self._own_tracing = self.memory and not tracemalloc.is_tracing()
+        if self._own_tracing:
+            tracemalloc.start()
+        self._stack = []
+        self._start = time.perf_counter_ns()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def close(self):
+        if self._own_tracing:
+            tracemalloc.stop()
+            self._own_tracing = False
+
+    def _charge_peak(self, name: str):
+        self.peaks[name] = max(self.peaks.get(name, 0), tracemalloc.get_traced_memory()[1])
+        tracemalloc.reset_peak()
+
+    @contextlib.contextmanager
+    def phase(self, name: str):
+        now = time.perf_counter_ns()
+        if self._stack:
+            outer = self._stack[-1]
+            self.phases[outer[0]] += now - outer[1]
+            if self.memory:
+                self._charge_peak(outer[0])
+        elif self.memory:
+            tracemalloc.reset_peak()
+        entry = [name, now]
+        self._stack.append(entry)
+        try:
+            yield
+        finally:
+            now = time.perf_counter_ns()
+            self._stack.pop()
+            self.phases[name] = self.phases.get(name, 0) + now - entry[1]
+            if self.memory:
+                self._charge_peak(name)
+            if self._stack:
+                self._stack[-1][1] = now
+
+    def finish(self, bits: int) -> dict:
+        """Закрывает замер, отдает запись всем хукам и возвращает ее."""
+        total = time.perf_counter_ns() - self._start
+        self.close()
+        record = {
+            "operation": self.operation,
+            "method": self.method,
+            "file": self.path,
+            "bits": bits,
+            "seconds": total / 1e9,
+            "total_ns": total,
+            "phases_ns": dict(self.phases),
+            "peak_bytes": self.peaks,
+        }
+        for hook, _ in list(_phase_hooks):
+            hook(record)
+        return record
 
 
-# ========== МЕТОД ПРОБЕЛОВ ==========
+def timer_phase(timer, name: str):
+    # Для вспомогательных функций, которым замер передается необязательно
+    return timer.phase(name) if timer is not None else contextlib.nullcontext()
 
-class StegoSpacesDocx:
-    def __init__(self):
-        self.SPACE_0 = "\u0020"  # Обычный пробел - бит 0
-        self.SPACE_1 = "\u202F"  # Узкий пробел без разрыва - бит 1
 
-    def embed(self, cover_file: str, secret: str, key: str, output_file: str):
-        start_time = time.time()
+def describe_phases(record) -> str:
+    # Короткая строка для GUI: фазы, занявшие время, в миллисекундах
+    parts = [f"{PHASE_LABELS.get(name, name)} {ns / 1e6:.1f}" for name, ns in record["phases_ns"].items() if ns]
+    return ", ".join(parts) + " мс" if parts else ""
 
-        doc = Document(cover_file)
-        full_text = " ".join([p.text for p in doc.paragraphs if p.text.strip() != ""])
 
-        mb = secret.encode("utf-8")
-        length_header = len(mb).to_bytes(4, "big")
-        payload = length_header + mb
+def phases_ms(record) -> dict:
+    return {name: ns / 1e6 for name, ns in record["phases_ns"].items()}
 
-        ks = keystream_bytes(key.encode("utf-8"), len(payload))
-        cipher = bytes(a ^ b for a, b in zip(payload, ks))
-        bits = bytes_to_bits(cipher)
 
-        words = full_text.split(" ")
-        if len(bits) > len(words) - 1:
-            raise ValueError("Недостаточно пробелов для внедрения")
+class PhaseLog:
+    """Хук, дописывающий записи в CSV (по расширению .csv) или JSON Lines."""
 
-        result = []
-        for i, w in enumerate(words):
-            result.append(w)
-            if i < len(words) - 1:
-                if i < len(bits):
-                    result.append(self.SPACE_0 if bits[i] == 0 else self.SPACE_1)
-                else:
-                    result.append(self.SPACE_0)
+    COLUMNS = (["operation", "method", "file", "bits", "total_ns"]
+               + [f"{name}_ns" for name in PHASES] + [f"{name}_peak_bytes" for name in PHASES])
 
-        stego_text = "".join(result)
-        new_doc = Document()
-        new_doc.add_paragraph(stego_text)
-        new_doc.save(output_file)
+    def __init__(self, path: str):
+        self.path = path
 
-        embed_time = time.time() - start_time
-        return embed_time, len(bits)
+    def write_header(self):
+        # Заголовок CSV пишется в пустой файл. Если лог ведут несколько процессов, вызывать
+        # до их запуска, иначе каждый может увидеть пустой файл и записать свой заголовок
+        if not self.path.lower().endswith(".csv"):
+            return
+        if not os.path.exists(self.path) or os.path.getsize(self.path) == 0:
+            with open(self.path, "a", encoding="utf-8", newline="") as f:
+                csv.DictWriter(f, fieldnames=self.COLUMNS).writeheader()
+
+    def __call__(self, record):
+        if self.path.lower().endswith(".csv"):
+            row = dict(record, **{f"{k}_ns": v for k, v in record["phases_ns"].items()},
+                       **{f"{k}_peak_bytes": v for k, v in (record["peak_bytes"] or {}).items()})
+            self.write_header()
+            with open(self.path, "a", encoding="utf-8", newline="") as f:
+                csv.DictWriter(f, fieldnames=self.COLUMNS, extrasaction="ignore").writerow(row)
+        else:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
 
-    def extract(self, stego_file: str, key: str) -> str:
-        start_time = time.time()
 
-        doc = Document(stego_file)
-        stego_text = " ".join([p.text for p in doc.paragraphs if p.text.strip() != ""])
+KEYSTREAM_MODES = ("sha256", "blake2b", "shake256")
+
 
-        bits = []
-        for char in stego_text:
-            if char == self.SPACE_0:
-                bits.append(0)
-            elif char == self.SPACE_1:
-                bits.append(1)
+class Keystream:
+    """Гамма в режиме счетчика: H(key || counter) для sha256/blake2b, XOF для shake256."""
+
+    def __init__(self, key: bytes, mode: str = "sha256"):
+        if mode not in KEYSTREAM_MODES:
+            raise ValueError(f"Неизвестный режим гаммы: {mode}")
+        self.mode = mode
+        # Состояние хеша после ключа считается один раз, дальше только .copy()
+        if mode == "sha256":
+            self._base = hashlib.sha256(key)
+        elif mode == "blake2b":
+            self._base = hashlib.blake2b(key)
+        else:
+            self._base = hashlib.shake_256(key)
+        self.block_size = self._base.digest_size
 
-        cipher = bits_to_bytes(bits)
-        ks = keystream_bytes(key.encode("utf-8"), len(cipher))
-        payload = bytes(a ^ b for a, b in zip(cipher, ks))
-        msg_len = int.from_bytes(payload[:4], "big")
-        msg_bytes = payload[4: 4 + msg_len]
+    def read(self, length: int, offset: int = 0) -> bytes:
+        """Возвращает length байт гаммы начиная с позиции offset."""
+        if length <= 0:
+            return b""
+        if self.mode == "shake256":
+            return self._base.digest(offset + length)[offset:]
 
-        extract_time = time.time() - start_time
-        return msg_bytes.decode("utf-8"), extract_time, len(bits)
+        bs = self.block_size
+        first = offset // bs
+        last = (offset + length + bs - 1) // bs
+        buf = bytearray((last - first) * bs)
+        view = memoryview(buf)
+        copy = self._base.copy
+        pos = 0
+        for counter in range(first, last):
+            h = copy()
+            h.update(counter.to_bytes(8, "big"))
+            view[pos:pos + bs] = h.digest()
+            pos += bs
+        skip = offset - first * bs
+        return bytes(view[skip:skip + length])
+
+
+def keystream_bytes(key: bytes, length: int, mode: str = "sha256", offset: int = 0) -> bytes:
+    return Keystream(key, mode).read(length, offset)
+
+
+def xor_bytes(data: bytes, ks: bytes) -> bytes:
+    # XOR целыми буферами вместо генератора по байтам
+    a = np.frombuffer(data, dtype=np.uint8)
+    b = np.frombuffer(ks, dtype=np.uint8, count=len(a))
+    return np.bitwise_xor(a, b).tobytes()
+
+
+def bytes_to_bits(b: bytes) -> np.ndarray:
+    # Массив битов (uint8, старший бит первым) без промежуточных списков
+    return np.unpackbits(np.frombuffer(b, dtype=np.uint8))
+
+
+def bits_to_bytes(bits) -> bytes:
+    # Неполный последний байт дополняется нулями
+    return np.packbits(np.asarray(bits, dtype=np.uint8)).tobytes()
+
+
+def bits_to_markers(bits, markers) -> str:
+    # Каждое значение превращается в свой символ-маркер: markers[i] для i (бит или символ алфавита)
+    table = dict(enumerate(markers))
+    return np.asarray(bits, dtype=np.uint8).tobytes().decode("latin-1").translate(table)
+
+
+def bytes_to_symbols(b: bytes, bits_per_symbol: int) -> np.ndarray:
+    # Биты группируются по bits_per_symbol (старший первым); хвост дополняется нулями
+    bits = bytes_to_bits(b)
+    if bits_per_symbol == 1:
+        return bits
+    bits = np.concatenate([bits, np.zeros(-len(bits) % bits_per_symbol, dtype=np.uint8)])
+    return np.packbits(bits.reshape(-1, bits_per_symbol), axis=1)[:, 0] >> (8 - bits_per_symbol)
+
+
+def symbols_to_bits(symbols, bits_per_symbol: int) -> np.ndarray:
+    # Обратная к bytes_to_symbols: каждый символ раскладывается на bits_per_symbol бит
+    symbols = np.asarray(symbols, dtype=np.uint8)
+    if bits_per_symbol == 1:
+        return symbols
+    return np.unpackbits(symbols[:, None], axis=1)[:, 8 - bits_per_symbol:].ravel()
+
+
+MARKER_CHUNK = 1 << 22  # символов за один векторный проход
+READ_CHUNK = 1 << 16  # блок при инкрементальном чтении, чтобы рано останавливаться
+
+
+@functools.lru_cache(maxsize=None)
+def _marker_codes(markers: tuple):
+    # Отсортированные кодовые точки маркеров и их значения в том же порядке
+    codes = np.array([ord(m) for m in markers], dtype=np.uint32)
+    order = np.argsort(codes)
+    return codes[order], order.astype(np.uint8)
 
 
-class StegoSpacesHTML:
-    def __init__(self):
-        self.SPACE_0 = "\u0020"
-        self.SPACE_1 = "\u202F"
+def iter_marker_bits(text: str, markers, chunk: int = MARKER_CHUNK):
+    """Значения маркеров из text по порядку, кусками по chunk символов.
 
-    def embed(self, cover_file: str, secret: str, key: str, output_file: str):
-        start_time = time.time()
+    Текст переводится в массив кодовых точек UCS-4, поиск идет сравнением массивов
+    без цикла по символам; markers[i] дает значение i.
+    """
+    codes, values = _marker_codes(tuple(markers))
+    for start in range(0, len(text), chunk):
+        block = np.frombuffer(text[start:start + chunk].encode("utf-32-le", "surrogatepass"), dtype=np.uint32)
+        found = block[np.isin(block, codes)]
+        if len(found):
+            yield values[np.searchsorted(codes, found)]
+
+
+def markers_to_bits(text: str, markers) -> np.ndarray:
+    """Обратная к bits_to_markers для всего текста сразу."""
+    parts = list(iter_marker_bits(text, markers))
+    return np.concatenate(parts) if parts else np.zeros(0, dtype=np.uint8)
+
+
+MMAP_CHUNK = 1 << 22  # байт за один векторный проход по отображенному файлу
 
-        try:
-            with open(cover_file, 'r', encoding='utf-8', errors='ignore') as f:
-                html_content = f.read()
-        except UnicodeDecodeError:
-            with open(cover_file, 'r', encoding='cp1251', errors='ignore') as f:
-                html_content = f.read()
 
-        soup = BeautifulSoup(html_content, 'html.parser')
+@functools.lru_cache(maxsize=None)
+def _utf8_marker_codes(markers: tuple):
+    # Маркеры как 24-битные числа из их трехбайтовых UTF-8 последовательностей
+    encoded = [m.encode("utf-8") for m in markers]
+    if any(len(e) != 3 for e in encoded):
+        raise ValueError("Байтовый поиск поддерживает только трехбайтовые маркеры")
+    codes = np.array([int.from_bytes(e, "big") for e in encoded], dtype=np.uint32)
+    order = np.argsort(codes)
+    return codes[order], order.astype(np.uint8), np.unique(codes >> 16).astype(np.uint8)
 
-        mb = secret.encode("utf-8")
-        length_header = len(mb).to_bytes(4, "big")
-        payload = length_header + mb
 
-        ks = keystream_bytes(key.encode("utf-8"), len(payload))
-        cipher = bytes(a ^ b for a, b in zip(payload, ks))
-        bits = bytes_to_bits(cipher)
+def iter_file_marker_bits(path: str, markers, chunk: int = MMAP_CHUNK):
+    """Значения маркеров прямо из байт UTF-8 файла через mmap, без декодирования и разбора.
+
+    Окно chunk байт (плюс 2 на маркер, переходящий границу) смотрится массивом numpy поверх mmap
+    без копирования, поэтому память не зависит от размера файла. В UTF-8 ведущий байт
+    не встречается внутри других символов, так что ложных совпадений на стыках нет.
+    """
+    codes, values, leads = _utf8_marker_codes(tuple(markers))
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if size < 3:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            # Там, где есть madvise (не Windows), прочитанные окна сразу выгружаются из памяти процесса
+            release = hasattr(mm, "madvise") and hasattr(mmap, "MADV_DONTNEED") and chunk % mmap.PAGESIZE == 0
+            if release and hasattr(mmap, "MADV_SEQUENTIAL"):
+                mm.madvise(mmap.MADV_SEQUENTIAL)
+            for start in range(0, size - 2, chunk):
+                n = min(chunk, size - 2 - start)  # позиции, с которых может начинаться маркер
+                block = np.frombuffer(mm, dtype=np.uint8, count=n + 2, offset=start)
+                head = block[:n]
+                pos = np.flatnonzero(head == leads[0] if len(leads) == 1 else np.isin(head, leads))
+                key = ((block[pos].astype(np.uint32) << 16) | (block[pos + 1].astype(np.uint32) << 8)
+                       | block[pos + 2])
+                found = values[np.searchsorted(codes, key[np.isin(key, codes)])]
+                # Представление mmap нужно отпустить до yield: иначе mmap нельзя закрыть при раннем выходе
+                del block, head
+                if release:
+                    mm.madvise(mmap.MADV_DONTNEED, start, n)
+                if len(found):
+                    yield found
+
+
+def iter_texts_bits(texts, markers):
+    # Биты маркеров из последовательности текстов (абзацев, узлов), по мере чтения
+    for text in texts:
+        yield from iter_marker_bits(text, markers)
+
+
+# Сжатие нагрузки перед шифрованием. Номер кодека хранится в старших битах
+# заголовка длины, поэтому файлы без сжатия (номер 0) читаются как раньше.
+COMPRESSION_CODECS = ("none", "zlib", "lzma", "bz2")
+LENGTH_BITS = 29
+LENGTH_MASK = (1 << LENGTH_BITS) - 1
+
+
+def compress_payload(data: bytes, codec: str = "none", level: int = None) -> bytes:
+    # level - уровень кодека (zlib 0-9, lzma preset 0-9, bz2 1-9); None - значение по умолчанию
+    level = None if level in (None, "") else int(level)
+    if codec == "zlib":
+        return zlib.compress(data, -1 if level is None else level)
+    if codec == "lzma":
+        return lzma.compress(data, preset=level)
+    if codec == "bz2":
+        return bz2.compress(data, 9 if level is None else level)
+    if codec == "none":
+        return data
+    raise ValueError(f"Неизвестный кодек сжатия: {codec}")
+
+
+def decompress_payload(data: bytes, codec: str) -> bytes:
+    try:
+        if codec == "zlib":
+            return zlib.decompress(data)
+        if codec == "lzma":
+            return lzma.decompress(data)
+        if codec == "bz2":
+            return bz2.decompress(data)
+    except (zlib.error, lzma.LZMAError, OSError, EOFError) as e:
+        raise ValueError("Не удалось распаковать сообщение (неверный ключ?)") from e
+    return data
+
+
+def secret_bytes(secret) -> bytes:
+    # embed принимает текст (кодируется в UTF-8) или готовые байты
+    return secret.encode("utf-8") if isinstance(secret, str) else bytes(secret)
+
+
+def build_payload(message: bytes, key: str, mode: str = "sha256", compression: str = "none",
+                  level: int = None, timer=None) -> bytes:
+    """Заголовок (кодек + длина) + сообщение, сжатое и зашифрованное гаммой.
+
+    Сжатый вариант берется, только если он короче исходного.
+    """
+    with timer_phase(timer, "payload"):
+        codec = compression
+        data = compress_payload(message, codec, level)
+        if len(data) >= len(message):
+            codec, data = "none", message
+        if len(data) > LENGTH_MASK:
+            raise ValueError("Сообщение слишком длинное")
+        header = (COMPRESSION_CODECS.index(codec) << LENGTH_BITS | len(data)).to_bytes(4, "big")
+        payload = header + data
+        with timer_phase(timer, "keystream"):
+            ks = keystream_bytes(key.encode("utf-8"), len(payload), mode)
+        return xor_bytes(payload, ks)
+
+
+class PayloadReader:
+    """Инкрементальное извлечение: сначала 32-битный заголовок длины, затем ровно
+    столько бит, сколько нужно сообщению; остальная часть документа не читается."""
+
+    HEADER_BITS = 32
+
+    def __init__(self, key: bytes, mode: str = "sha256", timer=None):
+        self.keystream = Keystream(key, mode)
+        self.timer = timer
+        self.msg_len = None
+        self.codec = None
+        self.needed = self.HEADER_BITS
+        self._chunks = []
+        self._count = 0
+
+    @property
+    def done(self) -> bool:
+        return self.msg_len is not None and self._count >= self.needed
+
+    @property
+    def received(self) -> int:
+        return self._count
+
+    def feed(self, bits) -> bool:
+        self._chunks.append(bits)
+        self._count += len(bits)
+        if self.msg_len is None and self._count >= self.HEADER_BITS:
+            with timer_phase(self.timer, "keystream"):
+                ks = self.keystream.read(4)
+            header = xor_bytes(bits_to_bytes(self._bits()[:self.HEADER_BITS]), ks)
+            header = int.from_bytes(header, "big")
+            self.msg_len = header & LENGTH_MASK
+            self.codec = header >> LENGTH_BITS
+            self.needed = self.HEADER_BITS + 8 * self.msg_len
+        return self.done
+
+    def _bits(self) -> np.ndarray:
+        if len(self._chunks) > 1:
+            self._chunks = [np.concatenate(self._chunks)]
+        return self._chunks[0] if self._chunks else np.zeros(0, dtype=np.uint8)
+
+    def message(self) -> bytes:
+        if not self.done:
+            raise ValueError("Недостаточно данных для извлечения")
+        if self.codec >= len(COMPRESSION_CODECS):
+            raise ValueError("Неизвестный кодек сжатия (неверный ключ?)")
+        cipher = bits_to_bytes(self._bits()[self.HEADER_BITS:self.needed])
+        with timer_phase(self.timer, "keystream"):
+            ks = self.keystream.read(self.msg_len, 4)
+        with timer_phase(self.timer, "payload"):
+            return decompress_payload(xor_bytes(cipher, ks), COMPRESSION_CODECS[self.codec])
+
+
+def read_payload(bit_chunks, key: str, mode: str = "sha256", progress=None, timer=None):
+    """Читает куски бит, пока их хватает на сообщение. Возвращает (сообщение, число бит).
+
+    progress(done, total) вызывается после каждого куска; total известен точно после заголовка.
+    С timer чтение кусков (разбор и поиск маркеров) идет в фазу "bitpack".
+    """
+    reader = PayloadReader(key.encode("utf-8"), mode, timer)
+    with timer_phase(timer, "bitpack"):
+        return _read_payload(reader, bit_chunks, progress)
+
+
+def _read_payload(reader, bit_chunks, progress):
+    for bits in bit_chunks:
+        done = reader.feed(bits)
+        if progress:
+            progress(min(reader.received, reader.needed), reader.needed)
+        if done:
+            break
+    return reader.message(), reader.needed
+
+
+def payload_bits(bit_chunks, key: str, mode: str = "sha256") -> int:
+    # Сколько бит занимает записанное сообщение - по его заголовку, без чтения самого сообщения
+    reader = PayloadReader(key.encode("utf-8"), mode)
+    for bits in bit_chunks:
+        reader.feed(bits)
+        if reader.msg_len is not None:
+            return reader.needed
+    raise ValueError("Недостаточно данных для извлечения")
+
+
+# Алфавит zero-width: первые 2**k символов несут по k бит на маркер.
+# Первые два - прежние ZW_0/ZW_1, поэтому k=1 совпадает со старым форматом.
+ZW_ALPHABET = ("\u200B", "\u200C", "\u200D", "\u2060", "\u2061", "\u2062", "\u2063", "\u2064")
+ZW_BITS_PER_MARKER = (1, 2, 3)
+# При k > 1 поток начинается с метки ZW_ALPHABET[2**k - 1]; при k=1 метки нет (старые файлы).
+# Метки 3 и 7 не бывают первым маркером в однобитном потоке, так что алфавит определяется однозначно.
+_ZW_TAGS = {2 ** k - 1: k for k in ZW_BITS_PER_MARKER if k > 1}
+# Для str.translate: удалить все маркеры. Перед встраиванием так же чистится и обложка -
+# U+200D из эмодзи или U+2060 в тексте иначе читались бы как символы нагрузки или метка
+_ZW_STRIP = dict.fromkeys(map(ord, ZW_ALPHABET))
+
+
+def zero_width_markers(cipher: bytes, bits_per_marker: int = 1) -> str:
+    """Маркеры zero-width для зашифрованной нагрузки: по bits_per_marker бит на символ."""
+    if bits_per_marker not in ZW_BITS_PER_MARKER:
+        raise ValueError(f"Неподдерживаемое число бит на маркер: {bits_per_marker}")
+    symbols = bytes_to_symbols(cipher, bits_per_marker)
+    tag = ZW_ALPHABET[2 ** bits_per_marker - 1] if bits_per_marker > 1 else ""
+    return tag + bits_to_markers(symbols, ZW_ALPHABET[:2 ** bits_per_marker])
+
+
+def zero_width_bits(symbol_chunks):
+    """Биты из кусков значений маркеров ZW_ALPHABET; размер алфавита берется из первого маркера.
+
+    Символы вне найденного подалфавита пропускаются: в однобитных файлах, записанных до очистки
+    обложки, U+200D и U+2060 из исходного текста не относятся к нагрузке.
+    """
+    bits_per_marker = None
+    for symbols in symbol_chunks:
+        if bits_per_marker is None:
+            bits_per_marker = _ZW_TAGS.get(int(symbols[0]), 1)
+            if bits_per_marker > 1:
+                symbols = symbols[1:]
+        yield symbols_to_bits(symbols[symbols < 2 ** bits_per_marker], bits_per_marker)
+
+
+def interleave(parts, separators) -> str:
+    # parts[0] + separators[0] + parts[1] + ...; оставшиеся parts дописываются без разделителей
+    k = len(separators)
+    out = [""] * (2 * k + 1)
+    out[0:2 * k:2] = parts[:k]
+    out[1:2 * k:2] = separators
+    out[2 * k] = "".join(parts[k:])
+    return "".join(out)
+
+
+# Таблица пробельных символов (str.isspace) для векторной обработки кодовых точек
+_WS_LIMIT = 0x3001
+_IS_SPACE = np.array([chr(c).isspace() for c in range(_WS_LIMIT)])
+
+
+def insert_after_letters(text: str, markers: str):
+    """Вставляет markers по одному после непробельных символов text.
+
+    Возвращает новый текст и число использованных маркеров.
+    """
+    codes = np.frombuffer(text.encode("utf-32-le"), dtype=np.uint32)
+    spaces = np.zeros(len(codes), dtype=bool)
+    low = codes < _WS_LIMIT
+    spaces[low] = _IS_SPACE[codes[low]]
+    slots = np.flatnonzero(~spaces)[:len(markers)]
+    used = markers[:len(slots)]
+    out = np.insert(codes, slots + 1, np.frombuffer(used.encode("utf-32-le"), dtype=np.uint32))
+    return out.tobytes().decode("utf-32-le"), len(used)
+
+
+def count_letters(text: str) -> int:
+    # Число непробельных символов - позиций, после которых insert_after_letters ставит маркер
+    codes = np.frombuffer(text.encode("utf-32-le"), dtype=np.uint32)
+    low = codes < _WS_LIMIT
+    return len(codes) - int(np.count_nonzero(_IS_SPACE[codes[low]]))
+
+
+def rewrite_html_nodes(text_nodes, markers: str, rewrite_node, progress=None) -> int:
+    # Общий проход по текстовым узлам: rewrite_node(text, markers, pos) -> (new_text | None, pos)
+    pos = 0
+    for text_node in text_nodes:
+        if pos >= len(markers):
+            break
+        new_text, pos = rewrite_node(str(text_node), markers, pos)
+        if new_text is not None:
+            text_node.replace_with(new_text)
+            if progress:
+                progress(pos, len(markers))
+    return pos
+
+
+def update_nodes(nodes, markers: str, rewrite_node, strip_node, old_slots=float("inf"), progress=None):
+    """Общий проход update по готовому стего-файлу. Возвращает (изменения, число записанных маркеров).
+
+    nodes - пары (узел, текст). strip_node(text) -> (текст обложки, маркеров старого потока в узле,
+    позиций в узле); старый поток кончился, когда узел заполнен не целиком или пройдено old_slots позиций.
+    В изменения [(узел, новый текст)] попадают только узлы, текст которых действительно меняется,
+    а обход останавливается сразу, как только записаны новые маркеры и пройден конец старого потока.
+    """
+    step = UpdateStep(markers, rewrite_node, strip_node, old_slots, progress)
+    changes = []
+    for node, text in nodes:
+        new_text, stop = step(text)
+        if new_text != text:
+            changes.append((node, new_text))
+        if stop:
+            break
+    return changes, step.pos
+
+
+class UpdateStep:
+    """Шаг update для одного узла: step(text) -> (новый текст, можно ли остановить обход).
+
+    Общий для update_nodes и потокового движка DOCX; pos - записано маркеров, changed - изменено узлов.
+    """
+
+    def __init__(self, markers: str, rewrite_node, strip_node, old_slots=float("inf"), progress=None):
+        self.markers = markers
+        self.rewrite_node = rewrite_node
+        self.strip_node = strip_node
+        self.old_slots = old_slots
+        self.progress = progress
+        self.pos = self.old_pos = self.changed = 0
+
+    def __call__(self, text: str):
+        cover, held, slots = self.strip_node(text)
+        self.old_pos += held
+        new_text = None
+        if self.pos < len(self.markers):
+            new_text, self.pos = self.rewrite_node(cover, self.markers, self.pos)
+        if new_text is None:
+            new_text = cover
+        if new_text != text:
+            self.changed += 1
+            if self.progress:
+                self.progress(self.pos, len(self.markers))
+        return new_text, self.pos >= len(self.markers) and (held < slots or self.old_pos >= self.old_slots)
+
+
+@contextlib.contextmanager
+def atomic_output(path: str):
+    # Запись во временный файл рядом с path и замена: update может писать поверх собственного источника
+    tmp = path + ".tmp"
+    try:
+        yield tmp
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+# ---------- HTML: парсеры и обход текстовых узлов ----------
+
+# "stream" - потоковый обход без построения дерева, остальные - бэкенды BeautifulSoup
+HTML_PARSERS = ("html.parser", "lxml", "html5lib", "stream")
+HIDDEN_TAGS = ("script", "style", "meta", "head")
+# Пустые элементы html.parser-бэкенда BeautifulSoup
+VOID_TAGS = {"area", "base", "basefont", "bgsound", "br", "col", "command", "embed", "frame",
+             "hr", "image", "img", "input", "isindex", "keygen", "link", "menuitem", "meta",
+             "nextid", "param", "source", "spacer", "track", "wbr"}
+RAW_TEXT_TAGS = ("script", "style")
+# Внутри них html.parser не схлопывает строки из одних пробелов
+PRESERVE_WHITESPACE_TAGS = ("pre", "textarea")
+_ASCII_SPACES = " \n\t\x0c\r"
+
+_HTML_TOKEN = re.compile(
+    r"<!--.*?(?:-->|$)"
+    r"|<[!?][^>]*>"
+    r"|<(/?)([A-Za-z][^\s/>]*)((?:[^>\"']|\"[^\"]*\"|'[^']*')*)>",
+    re.S,
+)
+# Начало тега, обрезанное концом куска: при потоковом чтении такое место ждет следующего куска
+_HTML_PARTIAL = re.compile(
+    r"<[!?][^>]*\Z"
+    r"|<(?:/?[A-Za-z][^\s/>]*(?:[^>\"']|\"[^\"]*\"|'[^']*')*(?:\"[^\"]*|'[^']*)?|/)?\Z",
+    re.S,
+)
+HTML_CHUNK = 1 << 20  # символов за одно чтение в потоковом режиме
+_ENTITY_MAX = 40  # длиннее именованных сущностей HTML не бывает
+
+
+def read_html_file(path: str) -> str:
+    try:
+        with open(path, 'r', encoding='utf-8', errors='ignore') as f:
+            return f.read()
+    except UnicodeDecodeError:
+        with open(path, 'r', encoding='cp1251', errors='ignore') as f:
+            return f.read()
+
+
+def iter_html_segments(html_content: str):
+    """Разбивает HTML на сегменты (raw, visible) без построения дерева.
+
+    visible=True у текстовых узлов, которые BeautifulSoup-фильтр считает видимыми:
+    непосредственный родитель не из HIDDEN_TAGS и текст не пустой. Закрывающий тег без открытого
+    элемента html.parser пропускает, а smooth() склеивает текст по обе стороны от него - здесь такой
+    текст тоже считается одним узлом (пробельный кусок рядом с видимым текстом сам видим), а </br>
+    после <br> поглощает целиком, даже не прерывая строку.
+    Строку из одних ASCII-пробелов BeautifulSoup хранит как "\n" или " ": у такого видимого куска
+    visible - этот символ, а не True (текст сегмента - см. segment_text).
+    raw - исходный фрагмент документа (сущности не раскрыты), "".join(raw) == html_content.
+    """
+    return iter_html_chunk_segments((html_content,))
+
+
+def segment_text(raw: str, visible) -> str:
+    # Видимый текст сегмента iter_html_segments
+    return visible if isinstance(visible, str) else html.unescape(raw)
+
+
+def iter_html_file_segments(path: str, chunk: int = HTML_CHUNK):
+    # Сегменты файла, прочитанного кусками (кодировка и переводы строк - как в read_html_file)
+    with open(path, 'r', encoding='utf-8', errors='ignore') as f:
+        yield from iter_html_chunk_segments(iter(lambda: f.read(chunk), ""), chunk)
+
+
+def iter_html_chunk_segments(chunks, flush: int = HTML_CHUNK):
+    """iter_html_segments по кускам документа: в памяти текущий кусок и недоразобранный хвост.
+
+    Тег или содержимое script/style на стыке кусков дочитываются из следующего куска, так что
+    сегменты те же, что при разборе всей строки. Исключение - текстовый узел длиннее flush:
+    как только ясно, что он видимый, он выдается частями (не внутри сущностей). Позиции для бит
+    в частях те же, что в целом узле, поэтому извлечение от этого не зависит.
+    """
+    chunks = iter(chunks)
+    following = next(chunks, None)
+    buf = ""
+    pos = 0
+    stack = []
+    raw_end = None  # закрывающий тег script/style, пока идет его содержимое
+    closed_void = []  # void-теги без "/>": их закрывающий тег html.parser поглощает целиком
+    split = False  # текущий текстовый узел уже признан видимым и выдается частями
+    pending = []  # (raw, visible) сегменты узла, пока не ясно, видим ли он
+    spaces = []  # (raw, is_text) текущей строки, пока в ней одни ASCII-пробелы
+    solid = False  # в текущей строке есть не только ASCII-пробелы
+
+    def node_segment(raw, visible):
+        if split:
+            yield raw, visible
+        else:
+            pending.append((raw, visible))
+
+    def text_segments(text, parent):
+        # Кусок строки между тегами; строка кончается только на теге, который прерывает строку
+        nonlocal split, solid
+        plain = html.unescape(text) if "&" in text else text
+        if parent in HIDDEN_TAGS:
+            yield text, False
+            return
+        if not solid and not plain.strip(_ASCII_SPACES) \
+                and not any(tag in stack for tag in PRESERVE_WHITESPACE_TAGS):
+            spaces.append((text, True))
+            return
+        solid = True
+        for raw, is_text in spaces:
+            yield from node_segment(raw, is_text)
+        spaces.clear()
+        if plain.isspace():
+            yield from node_segment(text, True)
+            return
+        if not split:
+            yield from pending
+            pending.clear()
+            split = True
+        yield text, True
+
+    def end_string():
+        # Строку из одних ASCII-пробелов BeautifulSoup заменяет на "\n" или " " - один сегмент
+        nonlocal solid
+        if spaces:
+            raw = "".join(part for part, _ in spaces)
+            spaces.clear()
+            plain = html.unescape(raw) if "&" in raw else raw
+            yield from node_segment(raw, "\n" if "\n" in plain else " ")
+        solid = False
+
+    def end_node():
+        nonlocal split
+        yield from end_string()
+        for raw, _ in pending:
+            yield raw, False
+        pending.clear()
+        split = False
+
+    while following is not None:
+        buf = buf[pos:] + following
+        pos = 0
+        following = next(chunks, None)
+        eof = following is None
+        while True:
+            if raw_end is not None:
+                # Содержимое script/style не разбирается до закрывающего тега
+                end = raw_end.search(buf, pos)
+                if end is None and not eof:
+                    keep = buf.rfind("<", pos)
+                    keep = len(buf) if keep < 0 else keep
+                    if keep > pos:
+                        yield buf[pos:keep], False
+                        pos = keep
+                    break
+                body_end = end.start() if end else len(buf)
+                if body_end > pos:
+                    yield buf[pos:body_end], False
+                pos = body_end
+                if end:
+                    yield end.group(0), False
+                    pos = end.end()
+                raw_end = None
+                continue
+
+            m = _HTML_TOKEN.search(buf, pos)
+            wait = None
+            if not eof:
+                # Незаконченный тег: до найденного (search его пропустил) или сам найденный комментарий
+                limit = m.start() if m else len(buf)
+                c = buf.find("<", pos, limit)
+                while c >= 0 and wait is None:
+                    if _HTML_PARTIAL.match(buf, c):
+                        wait = c
+                    c = buf.find("<", c + 1, limit)
+                # "<!-->" в конце куска - начало комментария, а не целый комментарий
+                if wait is None and m is not None and m.group(0).startswith("<!--") \
+                        and not m.group(0)[4:].endswith("-->"):
+                    wait = m.start()
+            parent = stack[-1] if stack else None
+
+            if m is None or wait is not None:
+                if eof:
+                    text = buf[pos:]
+                    if text:
+                        yield from text_segments(text, parent)
+                    yield from end_node()
+                    pos = len(buf)
+                    break
+                limit = len(buf) if wait is None else wait
+                if limit - pos > flush and parent not in HIDDEN_TAGS:
+                    # Длинный текстовый узел: часть до последней возможной сущности уходит сразу
+                    amp = buf.rfind("&", max(pos, limit - _ENTITY_MAX), limit)
+                    cut = limit if amp < 0 else amp
+                    piece = buf[pos:cut]
+                    plain = html.unescape(piece) if "&" in piece else piece
+                    if piece and (solid or not plain.isspace()):
+                        yield from text_segments(piece, parent)
+                        pos = cut
+                break
 
-        text_nodes = []
-        for element in soup.find_all(text=True):
-            if element.parent.name not in ['script', 'style', 'meta', 'head'] and element.strip():
-                text_nodes.append(element)
+            closing, name = m.group(1), m.group(2)
+            if name is not None:
+                name = name.lower()
+            start = m.start()
+            if start > pos:
+                yield from text_segments(buf[pos:start], parent)
+            pos = m.end()
+            if closing and name in closed_void:
+                # Не прерывает даже строку: текст по обе стороны - одна строка BeautifulSoup
+                closed_void.remove(name)
+                if spaces:
+                    spaces.append((m.group(0), False))
+                elif solid or split or pending:
+                    yield from node_segment(m.group(0), False)
+                else:
+                    yield m.group(0), False
+                continue
+            if closing and name not in stack and (split or pending or spaces or solid):
+                # Лишний закрывающий тег прерывает строку, но smooth() склеивает узел обратно
+                yield from end_string()
+                yield from node_segment(m.group(0), False)
+                continue
+            yield from end_node()
+            yield m.group(0), False
 
+            if name is None:
+                continue
+            if closing:
+                if name in stack:
+                    while stack.pop() != name:
+                        pass
+            elif name in RAW_TEXT_TAGS:
+                raw_end = re.compile(rf"</{name}\s*>", re.I)
+            elif name in VOID_TAGS:
+                if not m.group(3).endswith("/"):
+                    closed_void.append(name)
+            elif not m.group(3).endswith("/"):
+                stack.append(name)
+
+
+def html_text_nodes(soup):
+    # Видимые текстовые узлы: без комментариев/doctype и содержимого служебных тегов.
+    # Соседние строки склеиваются, как это произойдет при повторном разборе сохраненного файла
+    soup.smooth()
+    text_nodes = []
+    for element in soup.find_all(string=True):
+        if isinstance(element, PreformattedString):
+            continue
+        if element.parent.name not in HIDDEN_TAGS and element.strip():
+            text_nodes.append(element)
+    return text_nodes
+
+
+def iter_html_visible_text(html_content: str, parser: str = "html.parser"):
+    # Тексты видимых узлов по порядку; в режиме stream разбор идет лениво
+    if parser == "stream":
+        for raw, visible in iter_html_segments(html_content):
+            if visible:
+                yield segment_text(raw, visible)
+    else:
+        yield from map(str, html_text_nodes(BeautifulSoup(html_content, parser)))
+
+
+def html_visible_text(html_content: str, parser: str = "html.parser") -> str:
+    return "".join(iter_html_visible_text(html_content, parser))
+
+
+def embed_html(html_content: str, markers: str, rewrite_node, parser: str = "html.parser", progress=None,
+               timer=None):
+    """Встраивает маркеры в видимый текст и возвращает (новый HTML, число встроенных маркеров)."""
+    if parser not in HTML_PARSERS:
+        raise ValueError(f"Неизвестный HTML-парсер: {parser}")
+
+    if parser != "stream":
+        with timer_phase(timer, "parse"):
+            soup = BeautifulSoup(html_content, parser)
+            text_nodes = html_text_nodes(soup)
         if not text_nodes:
             raise ValueError("В HTML нет видимого текста")
+        with timer_phase(timer, "rewrite"):
+            used = rewrite_html_nodes(text_nodes, markers, rewrite_node, progress)
+        with timer_phase(timer, "serialize"):
+            return str(soup), used
+
+    # Потоковый режим: разбор и перезапись идут одним проходом
+    with timer_phase(timer, "rewrite"):
+        return _embed_html_stream(html_content, markers, rewrite_node, progress)
+
+
+def _embed_html_stream(html_content: str, markers: str, rewrite_node, progress=None):
+    out = []
+    pos = _embed_html_segments(iter_html_segments(html_content), markers, rewrite_node, out.append, progress)
+    return "".join(out), pos
+
+
+def embed_html_file(cover_file: str, output_file: str, markers: str, rewrite_node, progress=None,
+                    chunk: int = HTML_CHUNK) -> int:
+    """embed_html(parser="stream") из файла в файл: чтение, разбор и запись идут кусками по chunk символов.
+
+    Память ограничена куском и самым длинным тегом; результат извлекается так же, как после embed_html.
+    Возвращает число встроенных маркеров.
+    """
+    with open(output_file, 'w', encoding='utf-8') as f:
+        return _embed_html_segments(iter_html_file_segments(cover_file, chunk), markers, rewrite_node, f.write,
+                                    progress)
+
+
+def _embed_html_segments(segments, markers: str, rewrite_node, write, progress=None) -> int:
+    pos = 0
+    has_text = False
+    for raw, visible in segments:
+        if visible:
+            has_text = True
+        if visible and pos < len(markers):
+            new_text, pos = rewrite_node(segment_text(raw, visible), markers, pos)
+            if new_text is not None:
+                raw = html.escape(new_text, quote=False)
+                if progress:
+                    progress(pos, len(markers))
+        write(raw)
+    if not has_text:
+        raise ValueError("В HTML нет видимого текста")
+    return pos
+
+
+def update_html(html_content: str, markers: str, rewrite_node, strip_node, parser: str = "html.parser",
+                old_slots=float("inf"), progress=None, timer=None):
+    """update_nodes для HTML. Возвращает (новый HTML, число записанных маркеров, число измененных узлов).
+
+    В режиме stream узлы за концом старого и нового потоков даже не разбираются: хвост документа
+    копируется одним срезом.
+    """
+    if parser not in HTML_PARSERS:
+        raise ValueError(f"Неизвестный HTML-парсер: {parser}")
+
+    if parser != "stream":
+        with timer_phase(timer, "parse"):
+            soup = BeautifulSoup(html_content, parser)
+            nodes = [(node, str(node)) for node in html_text_nodes(soup)]
+        with timer_phase(timer, "rewrite"):
+            changes, used = update_nodes(nodes, markers, rewrite_node, strip_node, old_slots, progress)
+            for node, text in changes:
+                node.replace_with(text)
+        with timer_phase(timer, "serialize"):
+            return str(soup), used, len(changes)
+
+    with timer_phase(timer, "rewrite"):
+        changes, used = update_nodes(_iter_html_visible_spans(html_content), markers, rewrite_node, strip_node,
+                                     old_slots, progress)
+        out = []
+        last = 0
+        for (start, end), text in changes:
+            out += [html_content[last:start], html.escape(text, quote=False)]
+            last = end
+        out.append(html_content[last:])
+        return "".join(out), used, len(changes)
+
+
+def _iter_html_visible_spans(html_content: str):
+    # ((начало, конец) в исходной строке, текст) для видимых сегментов iter_html_segments
+    offset = 0
+    for raw, visible in iter_html_segments(html_content):
+        if visible:
+            yield (offset, offset + len(raw)), segment_text(raw, visible)
+        offset += len(raw)
+
+
+def docx_text_elements(doc):
+    # Элементы <w:t>, из которых python-docx собирает Paragraph.text (прямые runs и гиперссылки)
+    for p in doc.paragraphs:
+        for t in p._p.xpath("w:r/w:t | w:hyperlink/w:r/w:t"):
+            if t.text:
+                yield t
+
+
+def save_docx_part(source: str, output_file: str, part_name: str, data: bytes):
+    # Копия DOCX-архива, в которой заменена одна часть (например, word/document.xml)
+    with zipfile.ZipFile(source) as src, zipfile.ZipFile(output_file, "w", zipfile.ZIP_DEFLATED) as dst:
+        for item in src.infolist():
+            dst.writestr(item, data if item.filename == part_name else src.read(item.filename))
+
+
+# ---------- DOCX: потоковый движок OOXML (без python-docx) ----------
+
+# "stream" читает и пишет word/document.xml блоками, не строя дерево; "python-docx" - объектная модель
+DOCX_ENGINES = ("python-docx", "stream")
+OOXML_CHUNK = 1 << 20
+# Основная часть все равно пережимается; уровень 3 дает архив на ~20% больше уровня 6, но втрое быстрее
+OOXML_COMPRESSLEVEL = 3
+WORDML_NS = "http://schemas.openxmlformats.org/wordprocessingml/2006/main"
+# Пути <w:t>, из которых python-docx собирает Paragraph.text (те же, что в docx_text_elements)
+_DOCX_TEXT_PATHS = (("document", "body", "p", "r", "t"), ("document", "body", "p", "hyperlink", "r", "t"))
+_XML_TOKEN = re.compile(
+    r"<!--.*?-->"
+    r"|<!\[CDATA\[.*?\]\]>"
+    r"|<[?!][^>]*>"
+    r"|<(/?)([^\s/>]+)((?:[^>\"']|\"[^\"]*\"|'[^']*')*?)(/?)>",
+    re.S,
+)
+_XML_ENTITY = re.compile(r"&(?:#(\d+)|#x([0-9a-fA-F]+)|(amp|lt|gt|quot|apos));")
+_XML_NAMED = {"amp": "&", "lt": "<", "gt": ">", "quot": '"', "apos": "'"}
+
+
+def _xml_entity(m) -> str:
+    if m.group(3):
+        return _XML_NAMED[m.group(3)]
+    return chr(int(m.group(1)) if m.group(1) else int(m.group(2), 16))
+
+
+def xml_text(raw: str) -> str:
+    # Текст узла XML так, как его отдает парсер: сущности раскрыты, переводы строк нормализованы
+    if "\r" in raw:
+        raw = raw.replace("\r\n", "\n").replace("\r", "\n")
+    return _XML_ENTITY.sub(_xml_entity, raw) if "&" in raw else raw
+
+
+def docx_main_part(z: zipfile.ZipFile) -> str:
+    # Имя основной части документа по _rels/.rels (обычно word/document.xml)
+    try:
+        for rel in ElementTree.fromstring(z.read("_rels/.rels")):
+            if rel.get("Type", "").endswith("/officeDocument"):
+                return rel.get("Target").lstrip("/")
+    except (KeyError, ElementTree.ParseError):
+        pass
+    return "word/document.xml"
+
+
+class DocxTextReader:
+    """Потоковый разбор основной части DOCX: сегменты (raw, text) в порядке файла.
+
+    text - текст <w:t> с путей _DOCX_TEXT_PATHS (раскрытый), raw - его исходный вид;
+    у остальной разметки text=None, соседние куски такой разметки склеены. "".join(raw) == исходный XML.
+    В памяти одновременно держится один блок файла и текущий <w:t>.
+    После остановки обхода remainder() отдает еще не выданные байты, а остаток читается из f как есть.
+    """
+
+    def __init__(self, f, chunk: int = OOXML_CHUNK):
+        self.f = f
+        self.chunk = chunk
+        self._decoder = codecs.getincrementaldecoder("utf-8")()
+        self._buf = ""
+        self._pos = 0
+
+    def remainder(self) -> bytes:
+        return self._buf[self._pos:].encode("utf-8") + self._decoder.getstate()[0]
+
+    def _read(self) -> bool:
+        block = self.f.read(self.chunk)
+        self._buf = self._buf[self._pos:] + self._decoder.decode(block, final=not block)
+        self._pos = 0
+        return bool(block)
+
+    def __iter__(self):
+        stack = []
+        text_paths = ()
+        t_name = None
+        content = None  # начало текста текущего <w:t> в буфере
+        more = True
+        while more:
+            more = self._read()
+            buf = self._buf
+            pos = 0  # с этого места буфер еще не выдан
+            scan = 0 if content is None else content
+            while True:
+                lt = buf.find("<", scan)
+                if lt < 0:
+                    break
+                m = _XML_TOKEN.match(buf, lt)
+                if m is None:
+                    if not more:
+                        raise ValueError("Поврежденный XML в DOCX")
+                    break
+                scan = m.end()
+                closing, name = m.group(1), m.group(2)
+                if name is None:
+                    continue
+                if content is not None:
+                    # Внутри <w:t> других тегов нет: это его закрывающий тег.
+                    # _pos сдвигается до yield, чтобы remainder() был верен после остановки обхода
+                    if pos < content:
+                        self._pos = content
+                        yield buf[pos:content], None
+                    self._pos = pos = lt
+                    yield buf[content:lt], xml_text(buf[content:lt])
+                    content = None
+                    stack.pop()
+                    continue
+                if closing:
+                    stack.pop()
+                    continue
+                if not stack:
+                    # Корневой элемент: префикс пространства имен WordprocessingML
+                    ns = re.search(r"xmlns(?::([\w.-]+))?\s*=\s*[\"']" + re.escape(WORDML_NS), m.group(3))
+                    prefix = ns.group(1) + ":" if ns and ns.group(1) else ""
+                    text_paths = {tuple(prefix + n for n in path) for path in _DOCX_TEXT_PATHS}
+                    t_name = prefix + "t"
+                if m.group(4):
+                    continue
+                stack.append(name)
+                if name == t_name and tuple(stack) in text_paths:
+                    content = scan
+            # Выдается все до текущего <w:t> или до незаконченного тега; остальное ждет следующего блока
+            keep = content if content is not None else (lt if lt >= 0 else len(buf))
+            self._pos = keep
+            if keep > pos:
+                yield buf[pos:keep], None
+            if content is not None:
+                content -= keep
+        if self._pos < len(self._buf):
+            yield self._buf[self._pos:], None
+            self._pos = len(self._buf)
+
+
+def _zip_copy_info(item: zipfile.ZipInfo) -> zipfile.ZipInfo:
+    # Новая запись с теми же именем, датой, методом сжатия и атрибутами (CRC и размеры посчитает zipfile)
+    info = zipfile.ZipInfo(item.filename, item.date_time)
+    info.compress_type = item.compress_type
+    info.external_attr = item.external_attr
+    info.comment = item.comment
+    info.file_size = item.file_size
+    return info
+
+
+def iter_docx_texts(path: str, chunk: int = OOXML_CHUNK):
+    """Тексты <w:t> основной части DOCX по порядку; архив читается лениво, пока обход не остановлен."""
+    with zipfile.ZipFile(path) as z, z.open(docx_main_part(z)) as f:
+        for _, text in DocxTextReader(f, chunk):
+            if text:
+                yield text
+
+
+def rewrite_docx_stream(source: str, output_file: str, markers: str, rewrite_node, progress=None,
+                        chunk: int = OOXML_CHUNK) -> int:
+    """Потоковый аналог _embed_inplace: rewrite_node(text, markers, pos) -> (new_text | None, pos) для <w:t>.
+
+    Возвращает число встроенных маркеров.
+    """
+    pos = 0
+
+    def rewrite(text):
+        nonlocal pos
+        new_text, pos = rewrite_node(text, markers, pos)
+        if progress and new_text is not None and new_text != text:
+            progress(pos, len(markers))
+        return new_text, pos >= len(markers)
+
+    stream_docx_texts(source, output_file, rewrite, chunk)
+    return pos
+
+
+def update_docx_stream(source: str, output_file: str, markers: str, rewrite_node, strip_node,
+                       old_slots=float("inf"), progress=None, chunk: int = OOXML_CHUNK):
+    """Потоковый аналог update_nodes для DOCX. Возвращает (число записанных маркеров, измененных <w:t>)."""
+    step = UpdateStep(markers, rewrite_node, strip_node, old_slots, progress)
+    stream_docx_texts(source, output_file, step, chunk)
+    return step.pos, step.changed
+
+
+def stream_docx_texts(source: str, output_file: str, rewrite_text, chunk: int = OOXML_CHUNK):
+    """Копия DOCX, в которой текст каждого <w:t> основной части проходит через rewrite_text.
+
+    rewrite_text(text) -> (new_text | None, stop). Все части архива, кроме основной, копируются
+    блоками без изменений; в основной меняется только текст переписанных <w:t>, а после stop
+    ее остаток копируется без разбора.
+    """
+    with zipfile.ZipFile(source) as src, \
+            zipfile.ZipFile(output_file, "w", zipfile.ZIP_DEFLATED, compresslevel=OOXML_COMPRESSLEVEL) as dst:
+        main_part = docx_main_part(src)
+        for item in src.infolist():
+            if item.filename != main_part:
+                with src.open(item) as r, dst.open(_zip_copy_info(item), "w") as w:
+                    shutil.copyfileobj(r, w, chunk)
+                continue
+            # Основная часть может вырасти в несколько раз (zero-width): zip64 заранее, если это вероятно
+            zip64 = item.file_size > zipfile.ZIP64_LIMIT // 4
+            with src.open(item) as r, dst.open(item.filename, "w", force_zip64=zip64) as w:
+                reader = DocxTextReader(r, chunk)
+                out = []
+                size = 0
+                stop = False
+                for raw, text in reader:
+                    if text is not None:
+                        new_text, stop = rewrite_text(text)
+                        if new_text is not None and new_text != text:
+                            raw = xml_escape(new_text)
+                    out.append(raw)
+                    size += len(raw)
+                    if size >= chunk:
+                        # Мелкие сегменты пишутся пачками: у каждой записи в zip свой вызов crc32/deflate
+                        w.write("".join(out).encode("utf-8"))
+                        out.clear()
+                        size = 0
+                    if stop:
+                        break
+                w.write("".join(out).encode("utf-8"))
+                w.write(reader.remainder())
+                shutil.copyfileobj(r, w, chunk)
+
+
+# ---------- PDF: постраничное чтение, запись одним холстом ----------
+# Шрифт нужен TTF: стандартные шрифты PDF не кодируют кириллицу и маркеры.
+# Берется первый найденный; Vera из reportlab есть всегда, но без кириллицы
+PDF_FONT_CANDIDATES = (
+    "C:/Windows/Fonts/arial.ttf",
+    "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",
+    "/Library/Fonts/Arial Unicode.ttf",
+    os.path.join(os.path.dirname(reportlab.__file__), "fonts", "Vera.ttf"),
+)
+PDF_FONT_SIZE = 11
+PDF_LEADING = 14
+PDF_MARGIN = 50
+_PDF_TOKEN = re.compile(r"\S+\s*|\s+")
+
+
+@functools.lru_cache(maxsize=None)
+def pdf_font(path: str = None) -> str:
+    """Регистрирует TTF-шрифт для стего-PDF и возвращает его имя в reportlab.
+
+    Маркерам, которых нет в шрифте, назначается глиф пробела: zero-width - с нулевой шириной,
+    U+202F - с шириной обычного пробела. ToUnicode при этом указывает на сами маркеры,
+    поэтому они не видны на странице, но возвращаются extract_text как есть.
+    """
+    if path is None:
+        path = next(p for p in PDF_FONT_CANDIDATES if os.path.exists(p))
+    font = TTFont("Stego-" + os.path.splitext(os.path.basename(path))[0], path)
+    face = font.face
+    space = face.charToGlyph[0x20]
+    for marker in ZW_ALPHABET + ("\u202F",):
+        code = ord(marker)
+        if code not in face.charToGlyph:
+            face.charToGlyph[code] = space
+            face.charWidths[code] = face.charWidths[0x20] if marker == "\u202F" else 0
+    pdfmetrics.registerFont(font)
+    return font.fontName
+
+
+def iter_pdf_pages_text(path: str):
+    # Текст страниц по одной; PdfReader разбирает страницу только при обращении к ней
+    reader = PyPDF2.PdfReader(path)
+    for page in reader.pages:
+        yield page.extract_text() or ""
+
+
+def wrap_pdf_line(line: str, font: str, width: float):
+    # Перенос по словам; пробел остается в конце строки, чтобы позиции для битов не пропадали
+    out, cur, cur_width = [], "", 0.0
+    for token in _PDF_TOKEN.findall(line):
+        w = pdfmetrics.stringWidth(token, font, PDF_FONT_SIZE)
+        if cur and cur_width + w > width:
+            out.append(cur)
+            cur, cur_width = "", 0.0
+        cur += token
+        cur_width += w
+    out.append(cur)
+    return out
+
+
+def embed_pdf(cover_file: str, output_file: str, markers: str, rewrite_page, font_path: str = None,
+              progress=None, timer=None) -> int:
+    """Переписывает текст обложки постранично в новый PDF; возвращает число встроенных маркеров.
+
+    rewrite_page(text, markers, pos) -> (new_text | None, pos), как для узлов HTML.
+    Обложка читается по одной странице, но холст reportlab держит все готовые страницы
+    в памяти до c.save(): showPage ничего не пишет на диск, так что память растет с числом
+    страниц вывода (порядка 10 КБ на страницу текста). Холст на каждую страницу встроил бы шрифт
+    в каждую из них и раздул бы файл, поэтому выходной PDF по-прежнему собирается целиком.
+    Оформление исходного PDF не сохраняется, переполненная страница переносится на несколько.
+    """
+    font = pdf_font(font_path)
+    page_width, page_height = letter
+    c = canvas.Canvas(output_file, pagesize=letter, pageCompression=1)
+    pos = 0
+    pages = iter_pdf_pages_text(cover_file)
+    while True:
+        with timer_phase(timer, "parse"):
+            text = next(pages, None)
+        if text is None:
+            break
+        if pos < len(markers):
+            with timer_phase(timer, "rewrite"):
+                new_text, pos = rewrite_page(text, markers, pos)
+            if new_text is not None:
+                text = new_text
+            if progress:
+                progress(pos, len(markers))
+        with timer_phase(timer, "serialize"):
+            c.setFont(font, PDF_FONT_SIZE)
+            y = page_height - PDF_MARGIN
+            for line in text.split("\n"):
+                for part in wrap_pdf_line(line, font, page_width - 2 * PDF_MARGIN):
+                    if y < PDF_MARGIN:
+                        c.showPage()
+                        c.setFont(font, PDF_FONT_SIZE)
+                        y = page_height - PDF_MARGIN
+                    c.drawString(PDF_MARGIN, y, part)
+                    y -= PDF_LEADING
+            c.showPage()
+    with timer_phase(timer, "serialize"):
+        c.save()
+    return pos
+
+
+# ---------- Кэш разобранных обложек ----------
+SLOT_SENTINEL = "\uE000"  # символ из области частного использования на месте каждой позиции для бита
+
+
+class CoverTemplate:
+    """Обложка, сериализованная один раз: на месте каждой позиции для бита стоит SLOT_SENTINEL.
+
+    render подставляет маркеры в первые позиции и fill в остальные, без повторного разбора.
+    source и part_name нужны DOCX: остальные части архива копируются из исходного файла.
+    """
+
+    def __init__(self, text: str, fill: str, source: str = None, part_name: str = None):
+        self.text = text
+        self.fill = fill
+        self.slots = text.count(SLOT_SENTINEL)
+        self.source = source
+        self.part_name = part_name
+
+    @property
+    def nbytes(self) -> int:
+        return sys.getsizeof(self.text)
+
+    def render(self, markers: str):
+        """Возвращает (текст, число встроенных маркеров)."""
+        n = min(len(markers), self.slots)
+        parts = self.text.split(SLOT_SENTINEL, n)
+        parts[-1] = parts[-1].replace(SLOT_SENTINEL, self.fill)
+        return interleave(parts, markers[:n]), n
+
+
+class CoverCache:
+    """LRU-кэш CoverTemplate по (путь, mtime, размер, параметры метода).
+
+    Ограничен и числом записей, и суммарным размером шаблонов; шаблон крупнее max_bytes не кэшируется.
+    """
+
+    def __init__(self, max_entries: int = 16, max_bytes: int = 256 << 20):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.hits = self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, path: str, options: tuple, build):
+        """Шаблон обложки из кэша или build(); build может вернуть None, если шаблон невозможен."""
+        st = os.stat(path)
+        key = (os.path.abspath(path), st.st_mtime_ns, st.st_size) + options
+        with self._lock:
+            template = self._entries.get(key)
+            if template is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return template
+            self.misses += 1
+
+        template = build()
+        if template is None or template.nbytes > self.max_bytes:
+            return template
+        with self._lock:
+            # Старые версии того же файла больше не понадобятся
+            for stale in [k for k in self._entries if k[0] == key[0]]:
+                self.nbytes -= self._entries.pop(stale).nbytes
+            self._entries[key] = template
+            self.nbytes += template.nbytes
+            while len(self._entries) > self.max_entries or self.nbytes > self.max_bytes:
+                self.nbytes -= self._entries.popitem(last=False)[1].nbytes
+        return template
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+
+
+COVER_CACHE = CoverCache()
 
-        bit_index = 0
-        for text_node in text_nodes:
-            if bit_index >= len(bits):
-                break
 
-            text = text_node.string
-            words = text.split()
+# ========== МЕТОД ПРОБЕЛОВ ==========
+
+class StegoSpacesDocx:
+    def __init__(self, keystream_mode: str = "sha256", inplace: bool = True, compression: str = "none",
+                 compression_level: int = None, cover_cache: CoverCache = COVER_CACHE, engine: str = "python-docx"):
+        self.keystream_mode = keystream_mode
+        self.compression = compression  # один из COMPRESSION_CODECS; extract определяет по заголовку
+        self.compression_level = compression_level
+        # inplace=True - правка существующих runs, False - весь текст в один новый абзац
+        self.inplace = inplace
+        # Один из DOCX_ENGINES; "stream" всегда правит существующие <w:t> (как inplace) и не использует кэш
+        if engine not in DOCX_ENGINES:
+            raise ValueError(f"Неизвестный движок DOCX: {engine}")
+        self.engine = engine
+        # Повторные embed в ту же обложку берут готовый шаблон (только для inplace); None - без кэша
+        self.cover_cache = cover_cache
+        self.SPACE_0 = "\u0020"  # Обычный пробел - бит 0
+        self.SPACE_1 = "\u202F"  # Узкий пробел без разрыва - бит 1
+
+    def embed(self, cover_file: str, secret: str, key: str, output_file: str, progress=None):
+        with PhaseTimer("embed", self, cover_file) as timer:
+            cipher = build_payload(secret_bytes(secret), key, self.keystream_mode,
+                                   self.compression, self.compression_level, timer)
+            with timer.phase("bitpack"):
+                bits = bytes_to_bits(cipher)
+                markers = bits_to_markers(bits, (self.SPACE_0, self.SPACE_1))
+
+            if self.engine == "stream":
+                # Разбор, перезапись и запись идут одним проходом
+                with timer.phase("rewrite"), atomic_output(output_file) as tmp:
+                    used = rewrite_docx_stream(cover_file, tmp, markers, self._rewrite_node, progress)
+                    if used < len(markers):
+                        raise ValueError("Недостаточно пробелов для внедрения")
+                self.last_timing = timer.finish(len(bits))
+                return self.last_timing["seconds"], len(bits)
+
+            template = None
+            if self.inplace and self.cover_cache is not None:
+                with timer.phase("parse"):
+                    template = self.cover_cache.get(cover_file, ("spaces-docx",),
+                                                    lambda: self._build_template(cover_file))
+            if template is not None:
+                with timer.phase("rewrite"):
+                    xml, used = template.render(markers)
+                if used < len(markers):
+                    raise ValueError("Недостаточно пробелов для внедрения")
+                with timer.phase("serialize"):
+                    save_docx_part(template.source, output_file, template.part_name, xml.encode("utf-8"))
+                if progress:
+                    progress(used, len(markers))
+                self.last_timing = timer.finish(len(bits))
+                return self.last_timing["seconds"], len(bits)
+
+            with timer.phase("parse"):
+                doc = Document(cover_file)
+            with timer.phase("rewrite"):
+                if self.inplace:
+                    self._embed_inplace(doc, markers, progress)
+                else:
+                    doc = self._embed_flat(doc, markers, progress)
+            with timer.phase("serialize"):
+                doc.save(output_file)
+
+            self.last_timing = timer.finish(len(bits))
+            return self.last_timing["seconds"], len(bits)
 
-            if len(words) < 2:
+    def _build_template(self, cover_file: str):
+        # Все пробелы <w:t> заменяются на SLOT_SENTINEL, document.xml сериализуется один раз
+        doc = Document(cover_file)
+        texts = [t.text for t in docx_text_elements(doc)]
+        if any(SLOT_SENTINEL in text for text in texts):
+            return None
+        self._embed_inplace(doc, SLOT_SENTINEL * sum(text.count(self.SPACE_0) for text in texts))
+        return CoverTemplate(doc.part.blob.decode("utf-8"), self.SPACE_0, cover_file, doc.part.partname.lstrip("/"))
+
+    def _embed_inplace(self, doc, markers: str, progress=None):
+        # Пробелы внутри каждого <w:t> заменяются маркерами по порядку, разметка не меняется
+        pos = 0
+        for t in docx_text_elements(doc):
+            if pos >= len(markers):
+                break
+            new_text, pos = self._rewrite_node(t.text, markers, pos)
+            if new_text is None:
                 continue
+            t.text = new_text
+            if progress:
+                progress(pos, len(markers))
 
-            new_text = ""
-            for i, word in enumerate(words):
-                new_text += word
-                if i < len(words) - 1 and bit_index < len(bits):
-                    new_text += self.SPACE_0 if bits[bit_index] == 0 else self.SPACE_1
-                    bit_index += 1
-                elif i < len(words) - 1:
-                    new_text += self.SPACE_0
+        if pos < len(markers):
+            raise ValueError("Недостаточно пробелов для внедрения")
 
-            text_node.replace_with(new_text)
+    def _rewrite_node(self, text: str, markers: str, pos: int):
+        parts = text.split(self.SPACE_0)
+        if len(parts) < 2:
+            return None, pos
+        chunk = markers[pos:pos + len(parts) - 1]
+        return interleave(parts, chunk + self.SPACE_0 * (len(parts) - 1 - len(chunk))), pos + len(chunk)
+
+    def _strip_node(self, text: str):
+        # Каждый пробел (обычный или узкий) - позиция, занятая старым потоком
+        slots = text.count(self.SPACE_0) + text.count(self.SPACE_1)
+        return text.replace(self.SPACE_1, self.SPACE_0), slots, slots
+
+    def update(self, stego_file: str, secret: str, key: str, output_file: str = None, progress=None,
+               old_key: str = None):
+        """Записывает новое сообщение в готовый стего-файл, меняя только затронутые <w:t>.
+
+        Пробелы не различают "конец потока" и бит 0, поэтому без old_key (ключа прежнего сообщения)
+        документ просматривается до конца; с ним обход останавливается сразу за старым сообщением.
+        С engine="stream" дерево не строится: остаток основной части после остановки копируется
+        без разбора, поэтому время зависит от длины сообщений, а не документа.
+        output_file=None - файл перезаписывается на месте. Возвращает (время, бит, измененных <w:t>).
+        """
+        with PhaseTimer("update", self, stego_file) as timer:
+            cipher = build_payload(secret_bytes(secret), key, self.keystream_mode,
+                                   self.compression, self.compression_level, timer)
+            with timer.phase("bitpack"):
+                bits = bytes_to_bits(cipher)
+                markers = bits_to_markers(bits, (self.SPACE_0, self.SPACE_1))
+
+            if self.engine == "stream":
+                old_slots = float("inf")
+                if old_key is not None:
+                    with timer.phase("bitpack"):
+                        old_slots = payload_bits(iter_texts_bits(iter_docx_texts(stego_file),
+                                                                 (self.SPACE_0, self.SPACE_1)),
+                                                 old_key, self.keystream_mode)
+                with timer.phase("rewrite"), atomic_output(output_file or stego_file) as tmp:
+                    used, changed = update_docx_stream(stego_file, tmp, markers, self._rewrite_node,
+                                                       self._strip_node, old_slots, progress)
+                    if used < len(markers):
+                        raise ValueError("Недостаточно пробелов для внедрения")
+                self.last_timing = timer.finish(len(bits))
+                return self.last_timing["seconds"], len(bits), changed
+
+            with timer.phase("parse"):
+                doc = Document(stego_file)
+            old_slots = float("inf")
+            if old_key is not None:
+                with timer.phase("bitpack"):
+                    texts = (t.text for t in docx_text_elements(doc))
+                    old_slots = payload_bits(iter_texts_bits(texts, (self.SPACE_0, self.SPACE_1)), old_key,
+                                             self.keystream_mode)
+            with timer.phase("rewrite"):
+                nodes = ((t, t.text) for t in docx_text_elements(doc))
+                changes, used = update_nodes(nodes, markers, self._rewrite_node, self._strip_node, old_slots, progress)
+                if used < len(markers):
+                    raise ValueError("Недостаточно пробелов для внедрения")
+                for t, text in changes:
+                    t.text = text
+            with timer.phase("serialize"), atomic_output(output_file or stego_file) as tmp:
+                save_docx_part(stego_file, tmp, doc.part.partname.lstrip("/"), doc.part.blob)
+
+            self.last_timing = timer.finish(len(bits))
+            return self.last_timing["seconds"], len(bits), len(changes)
+
+    def _embed_flat(self, doc, markers: str, progress=None):
+        full_text = " ".join([p.text for p in doc.paragraphs if p.text.strip() != ""])
 
-        with open(output_file, 'w', encoding='utf-8') as f:
-            f.write(str(soup))
+        words = full_text.split(" ")
+        if len(markers) > len(words) - 1:
+            raise ValueError("Недостаточно пробелов для внедрения")
 
-        embed_time = time.time() - start_time
-        return embed_time, len(bits)
+        separators = markers + self.SPACE_0 * (len(words) - 1 - len(markers))
 
-    def extract(self, stego_file: str, key: str) -> str:
-        start_time = time.time()
+        new_doc = Document()
+        new_doc.add_paragraph(interleave(words, separators))
+        if progress:
+            progress(len(markers), len(markers))
+        return new_doc
+
+    def extract(self, stego_file: str, key: str, progress=None) -> str:
+        msg_bytes, extract_time, bits_count = self.extract_bytes(stego_file, key, progress)
+        return msg_bytes.decode("utf-8"), extract_time, bits_count
+
+    def extract_bytes(self, stego_file: str, key: str, progress=None):
+        with PhaseTimer("extract", self, stego_file) as timer:
+            if self.engine == "stream":
+                texts = iter_docx_texts(stego_file)
+            else:
+                with timer.phase("parse"):
+                    doc = Document(stego_file)
+                # Абзацы читаются по одному, пока не набрано нужное число бит
+                texts = (p.text for p in doc.paragraphs)
+            bit_chunks = iter_texts_bits(texts, (self.SPACE_0, self.SPACE_1))
+            msg_bytes, bits_count = read_payload(bit_chunks, key, self.keystream_mode, progress, timer)
 
-        try:
-            with open(stego_file, 'r', encoding='utf-8', errors='ignore') as f:
-                html_content = f.read()
-        except UnicodeDecodeError:
-            with open(stego_file, 'r', encoding='cp1251', errors='ignore') as f:
-                html_content = f.read()
+            self.last_timing = timer.finish(bits_count)
+            return msg_bytes, self.last_timing["seconds"], bits_count
 
-        soup = BeautifulSoup(html_content, 'html.parser')
-        full_text = soup.get_text()
 
-        bits = []
-        for char in full_text:
-            if char == self.SPACE_0:
-                bits.append(0)
-            elif char == self.SPACE_1:
-                bits.append(1)
+class StegoSpacesHTML:
+    def __init__(self, keystream_mode: str = "sha256", parser: str = "html.parser", compression: str = "none",
+                 compression_level: int = None, cover_cache: CoverCache = COVER_CACHE):
+        self.keystream_mode = keystream_mode
+        self.parser = parser  # один из HTML_PARSERS; "stream" пишет файл кусками и не использует кэш
+        self.cover_cache = cover_cache  # см. StegoSpacesDocx
+        self.compression = compression
+        self.compression_level = compression_level
+        self.SPACE_0 = "\u0020"
+        self.SPACE_1 = "\u202F"
 
-        cipher = bits_to_bytes(bits)
-        ks = keystream_bytes(key.encode("utf-8"), len(cipher))
-        payload = bytes(a ^ b for a, b in zip(cipher, ks))
-        msg_len = int.from_bytes(payload[:4], "big")
-        msg_bytes = payload[4: 4 + msg_len]
+    def embed(self, cover_file: str, secret: str, key: str, output_file: str, progress=None):
+        with PhaseTimer("embed", self, cover_file) as timer:
+            cipher = build_payload(secret_bytes(secret), key, self.keystream_mode,
+                                   self.compression, self.compression_level, timer)
+            with timer.phase("bitpack"):
+                bits = bytes_to_bits(cipher)
+                markers = bits_to_markers(bits, (self.SPACE_0, self.SPACE_1))
+
+            if self.parser == "stream":
+                # Постоянная память: файл читается, переписывается и пишется кусками
+                with timer.phase("rewrite"), atomic_output(output_file) as tmp:
+                    used = embed_html_file(cover_file, tmp, markers, self._rewrite_node, progress)
+                    if used < len(markers):
+                        raise ValueError("Недостаточно пробелов для внедрения")
+                self.last_timing = timer.finish(len(bits))
+                return self.last_timing["seconds"], len(bits)
+
+            template = None
+            if self.cover_cache is not None:
+                with timer.phase("parse"):
+                    template = self.cover_cache.get(cover_file, ("spaces-html", self.parser),
+                                                    lambda: self._build_template(cover_file))
+            if template is not None:
+                with timer.phase("rewrite"):
+                    stego_html, used = template.render(markers)
+                if progress:
+                    progress(used, len(markers))
+            else:
+                with timer.phase("parse"):
+                    html_content = read_html_file(cover_file)
+                stego_html, used = embed_html(html_content, markers, self._rewrite_node, self.parser, progress, timer)
+            if used < len(markers):
+                raise ValueError("Недостаточно пробелов для внедрения")
+
+            with timer.phase("serialize"), open(output_file, 'w', encoding='utf-8') as f:
+                f.write(stego_html)
+
+            self.last_timing = timer.finish(len(bits))
+            return self.last_timing["seconds"], len(bits)
+
+    def _build_template(self, cover_file: str):
+        # Тот же проход embed_html, но в каждую позицию пишется SLOT_SENTINEL.
+        # Каждая сущность (&#32; и т.п.) раскрывается максимум в один пробел, отсюда верхняя граница
+        html_content = read_html_file(cover_file)
+        if SLOT_SENTINEL in html_content:
+            return None
+        slots = html_content.count(self.SPACE_0) + html_content.count("&")
+        stego_html, _ = embed_html(html_content, SLOT_SENTINEL * slots, self._rewrite_node, self.parser)
+        return CoverTemplate(stego_html, self.SPACE_0)
+
+    def _rewrite_node(self, text: str, markers: str, pos: int):
+        # Каждый обычный пробел узла - позиция для бита; остальные пробельные символы не трогаются
+        parts = text.split(self.SPACE_0)
+        if len(parts) < 2:
+            return None, pos
+        chunk = markers[pos:pos + len(parts) - 1]
+        separators = chunk + self.SPACE_0 * (len(parts) - 1 - len(chunk))
+        return interleave(parts, separators), pos + len(chunk)
+
+    _strip_node = StegoSpacesDocx._strip_node
+
+    def update(self, stego_file: str, secret: str, key: str, output_file: str = None, progress=None,
+               old_key: str = None):
+        """Новое сообщение в готовом стего-файле; меняются только затронутые узлы (см. StegoSpacesDocx.update).
+
+        Возвращает (время, бит, измененных узлов).
+        """
+        with PhaseTimer("update", self, stego_file) as timer:
+            cipher = build_payload(secret_bytes(secret), key, self.keystream_mode,
+                                   self.compression, self.compression_level, timer)
+            with timer.phase("bitpack"):
+                bits = bytes_to_bits(cipher)
+                markers = bits_to_markers(bits, (self.SPACE_0, self.SPACE_1))
+
+            with timer.phase("parse"):
+                html_content = read_html_file(stego_file)
+            old_slots = float("inf")
+            if old_key is not None:
+                with timer.phase("bitpack"):
+                    texts = iter_html_visible_text(html_content, self.parser)
+                    old_slots = payload_bits(iter_texts_bits(texts, (self.SPACE_0, self.SPACE_1)), old_key,
+                                             self.keystream_mode)
+            stego_html, used, changed = update_html(html_content, markers, self._rewrite_node, self._strip_node,
+                                                    self.parser, old_slots, progress, timer)
+            if used < len(markers):
+                raise ValueError("Недостаточно пробелов для внедрения")
+
+            with timer.phase("serialize"), atomic_output(output_file or stego_file) as tmp:
+                with open(tmp, 'w', encoding='utf-8') as f:
+                    f.write(stego_html)
+
+            self.last_timing = timer.finish(len(bits))
+            return self.last_timing["seconds"], len(bits), changed
+
+    def extract(self, stego_file: str, key: str, progress=None) -> str:
+        msg_bytes, extract_time, bits_count = self.extract_bytes(stego_file, key, progress)
+        return msg_bytes.decode("utf-8"), extract_time, bits_count
+
+    def extract_bytes(self, stego_file: str, key: str, progress=None):
+        with PhaseTimer("extract", self, stego_file) as timer:
+            # Читаются только те узлы, в которые пишет embed
+            if self.parser == "stream":
+                texts = (segment_text(raw, visible) for raw, visible in iter_html_file_segments(stego_file) if visible)
+            else:
+                with timer.phase("parse"):
+                    html_content = read_html_file(stego_file)
+                texts = iter_html_visible_text(html_content, self.parser)
+            bit_chunks = iter_texts_bits(texts, (self.SPACE_0, self.SPACE_1))
+            msg_bytes, bits_count = read_payload(bit_chunks, key, self.keystream_mode, progress, timer)
 
-        extract_time = time.time() - start_time
-        return msg_bytes.decode("utf-8"), extract_time, len(bits)
+            self.last_timing = timer.finish(bits_count)
+            return msg_bytes, self.last_timing["seconds"], bits_count
 
 
 # ========== МЕТОД ZERO-WIDTH ==========
 
 class StegoZeroWidthDocx:
-    def __init__(self):
+    def __init__(self, keystream_mode: str = "sha256", inplace: bool = True, bits_per_marker: int = 1,
+                 compression: str = "none", compression_level: int = None, engine: str = "python-docx"):
+        self.keystream_mode = keystream_mode
+        self.compression = compression
+        self.compression_level = compression_level
+        # inplace=True - правка существующих runs, False - новый документ с run на каждый символ
+        self.inplace = inplace
+        if engine not in DOCX_ENGINES:  # см. StegoSpacesDocx
+            raise ValueError(f"Неизвестный движок DOCX: {engine}")
+        self.engine = engine
+        # 1 - два маркера (старый формат), 2/3 - алфавит из 4/8 символов; extract определяет сам
+        self.bits_per_marker = int(bits_per_marker)
         self.ZW_0 = "\u200B"
         self.ZW_1 = "\u200C"
-        self.MARKERS = {self.ZW_0: 0, self.ZW_1: 1}
-
-    def embed(self, cover_file: str, secret: str, key: str, output_file: str):
-        start_time = time.time()
-
-        doc = Document(cover_file)
-        full_text = "".join([p.text for p in doc.paragraphs])
-
-        mb = secret.encode("utf-8")
-        length_header = len(mb).to_bytes(4, "big")
-        payload = length_header + mb
+        self.MARKERS = ZW_ALPHABET
+
+    def embed(self, cover_file: str, secret: str, key: str, output_file: str, progress=None):
+        with PhaseTimer("embed", self, cover_file) as timer:
+            cipher = build_payload(secret_bytes(secret), key, self.keystream_mode,
+                                   self.compression, self.compression_level, timer)
+            bits_count = 8 * len(cipher)
+            with timer.phase("bitpack"):
+                markers = zero_width_markers(cipher, self.bits_per_marker)
+
+            if self.engine == "stream":
+                with timer.phase("rewrite"), atomic_output(output_file) as tmp:
+                    used = rewrite_docx_stream(cover_file, tmp, markers, self._rewrite_node, progress)
+                    if used < len(markers):
+                        raise ValueError("Недостаточно символов для внедрения")
+                self.last_timing = timer.finish(bits_count)
+                return self.last_timing["seconds"], bits_count
+
+            with timer.phase("parse"):
+                doc = Document(cover_file)
+            with timer.phase("rewrite"):
+                if self.inplace:
+                    self._embed_inplace(doc, markers, progress)
+                else:
+                    doc = self._embed_flat(doc, markers, progress)
+            with timer.phase("serialize"):
+                doc.save(output_file)
+
+            self.last_timing = timer.finish(bits_count)
+            return self.last_timing["seconds"], bits_count
+
+    def _embed_inplace(self, doc, markers: str, progress=None):
+        # Маркер ставится после каждого символа <w:t>, пока не кончатся биты
+        pos = 0
+        for t in docx_text_elements(doc):
+            if pos >= len(markers):
+                break
+            t.text, pos = self._rewrite_node(t.text, markers, pos)
+            if progress:
+                progress(pos, len(markers))
 
-        ks = keystream_bytes(key.encode("utf-8"), len(payload))
-        cipher = bytes(a ^ b for a, b in zip(payload, ks))
-        bits = bytes_to_bits(cipher)
+        if pos < len(markers):
+            raise ValueError("Недостаточно символов для внедрения")
 
-        if len(bits) > len(full_text):
+    def _rewrite_node(self, text: str, markers: str, pos: int):
+        text = text.translate(_ZW_STRIP)
+        chunk = markers[pos:pos + len(text)]
+        return interleave(text, chunk), pos + len(chunk)
+
+    def _strip_node(self, text: str):
+        # Маркеры идут подряд с первого символа, так что конец старого потока виден без ключа
+        cover = text.translate(_ZW_STRIP)
+        return cover, len(text) - len(cover), len(cover)
+
+    def update(self, stego_file: str, secret: str, key: str, output_file: str = None, progress=None):
+        """Записывает новое сообщение в готовый стего-файл, меняя только затронутые <w:t>.
+
+        Старые маркеры снимаются только там, где они есть: обход кончается за концом старого
+        и нового потоков. output_file=None - файл перезаписывается на месте.
+        Возвращает (время, бит, измененных <w:t>).
+        """
+        with PhaseTimer("update", self, stego_file) as timer:
+            cipher = build_payload(secret_bytes(secret), key, self.keystream_mode,
+                                   self.compression, self.compression_level, timer)
+            bits_count = 8 * len(cipher)
+            with timer.phase("bitpack"):
+                markers = zero_width_markers(cipher, self.bits_per_marker)
+
+            if self.engine == "stream":
+                with timer.phase("rewrite"), atomic_output(output_file or stego_file) as tmp:
+                    used, changed = update_docx_stream(stego_file, tmp, markers, self._rewrite_node,
+                                                       self._strip_node, progress=progress)
+                    if used < len(markers):
+                        raise ValueError("Недостаточно символов для внедрения")
+                self.last_timing = timer.finish(bits_count)
+                return self.last_timing["seconds"], bits_count, changed
+
+            with timer.phase("parse"):
+                doc = Document(stego_file)
+            with timer.phase("rewrite"):
+                nodes = ((t, t.text) for t in docx_text_elements(doc))
+                changes, used = update_nodes(nodes, markers, self._rewrite_node, self._strip_node, progress=progress)
+                if used < len(markers):
+                    raise ValueError("Недостаточно символов для внедрения")
+                for t, text in changes:
+                    t.text = text
+            with timer.phase("serialize"), atomic_output(output_file or stego_file) as tmp:
+                save_docx_part(stego_file, tmp, doc.part.partname.lstrip("/"), doc.part.blob)
+
+            self.last_timing = timer.finish(bits_count)
+            return self.last_timing["seconds"], bits_count, len(changes)
+
+    def _embed_flat(self, doc, markers: str, progress=None):
+        full_text = "".join([p.text for p in doc.paragraphs]).translate(_ZW_STRIP)
+
+        if len(markers) > len(full_text):
             raise ValueError("Недостаточно символов для внедрения")
 
         new_doc = Document()
         p = new_doc.add_paragraph()
 
         for i, ch in enumerate(full_text):
-            if i < len(bits):
-                marker = self.ZW_0 if bits[i] == 0 else self.ZW_1
-                p.add_run(ch + marker)
+            if i < len(markers):
+                p.add_run(ch + markers[i])
+                if progress and i % 1024 == 0:
+                    progress(i, len(markers))
             else:
                 p.add_run(ch)
 
-        new_doc.save(output_file)
-
-        embed_time = time.time() - start_time
-        return embed_time, len(bits)
-
-    def extract(self, stego_file: str, key: str) -> str:
-        start_time = time.time()
-
-        doc = Document(stego_file)
-        full_text = "".join([p.text for p in doc.paragraphs])
-
-        bits = []
-        for ch in full_text:
-            if ch in self.MARKERS:
-                bits.append(self.MARKERS[ch])
-
-        if len(bits) < 32:
-            raise ValueError("Недостаточно данных для извлечения")
+        return new_doc
 
-        cipher = bits_to_bytes(bits)
-        ks = keystream_bytes(key.encode("utf-8"), len(cipher))
-        payload = bytes(a ^ b for a, b in zip(cipher, ks))
+    def extract(self, stego_file: str, key: str, progress=None) -> str:
+        msg_bytes, extract_time, bits_count = self.extract_bytes(stego_file, key, progress)
+        return msg_bytes.decode("utf-8"), extract_time, bits_count
 
-        msg_len = int.from_bytes(payload[:4], "big")
-        msg_bytes = payload[4: 4 + msg_len]
+    def extract_bytes(self, stego_file: str, key: str, progress=None):
+        with PhaseTimer("extract", self, stego_file) as timer:
+            if self.engine == "stream":
+                texts = iter_docx_texts(stego_file)
+            else:
+                with timer.phase("parse"):
+                    doc = Document(stego_file)
+                texts = (p.text for p in doc.paragraphs)
+            bit_chunks = zero_width_bits(iter_texts_bits(texts, self.MARKERS))
+            msg_bytes, bits_count = read_payload(bit_chunks, key, self.keystream_mode, progress, timer)
 
-        extract_time = time.time() - start_time
-        return msg_bytes.decode("utf-8"), extract_time, len(bits)
+            self.last_timing = timer.finish(bits_count)
+            return msg_bytes, self.last_timing["seconds"], bits_count
 
 
 class StegoZeroWidthHTML:
-    def __init__(self):
+    def __init__(self, keystream_mode: str = "sha256", parser: str = "html.parser", bits_per_marker: int = 1,
+                 compression: str = "none", compression_level: int = None):
+        self.keystream_mode = keystream_mode
+        self.parser = parser  # один из HTML_PARSERS
+        self.compression = compression
+        self.compression_level = compression_level
+        self.bits_per_marker = int(bits_per_marker)  # см. StegoZeroWidthDocx
         self.ZW_0 = "\u200B"
         self.ZW_1 = "\u200C"
-        self.MARKERS = {self.ZW_0: 0, self.ZW_1: 1}
-
-    def embed(self, cover_file: str, secret: str, key: str, output_file: str):
-        start_time = time.time()
-
-        try:
-            with open(cover_file, 'r', encoding='utf-8', errors='ignore') as f:
-                html_content = f.read()
-        except UnicodeDecodeError:
-            with open(cover_file, 'r', encoding='cp1251', errors='ignore') as f:
-                html_content = f.read()
-
-        soup = BeautifulSoup(html_content, 'html.parser')
-
-        mb = secret.encode("utf-8")
-        length_header = len(mb).to_bytes(4, "big")
-        payload = length_header + mb
-
-        ks = keystream_bytes(key.encode("utf-8"), len(payload))
-        cipher = bytes(a ^ b for a, b in zip(payload, ks))
-        bits = bytes_to_bits(cipher)
-
-        text_nodes = []
-        for element in soup.find_all(text=True):
-            if element.parent.name not in ['script', 'style', 'meta', 'head'] and element.strip():
-                text_nodes.append(element)
-
-        if not text_nodes:
-            raise ValueError("В HTML нет видимого текста")
-
-        bit_index = 0
-        for text_node in text_nodes:
-            if bit_index >= len(bits):
-                break
-
-            text = text_node.string
-            new_text = ""
-
-            for char in text:
-                new_text += char
-                if bit_index < len(bits) and char.strip():
-                    marker = self.ZW_0 if bits[bit_index] == 0 else self.ZW_1
-                    new_text += marker
-                    bit_index += 1
-
-            text_node.replace_with(new_text)
-
-        with open(output_file, 'w', encoding='utf-8') as f:
-            f.write(str(soup))
-
-        embed_time = time.time() - start_time
-        return embed_time, len(bits)
-
-    def extract(self, stego_file: str, key: str) -> str:
-        start_time = time.time()
-
-        try:
-            with open(stego_file, 'r', encoding='utf-8', errors='ignore') as f:
-                html_content = f.read()
-        except UnicodeDecodeError:
-            with open(stego_file, 'r', encoding='cp1251', errors='ignore') as f:
-                html_content = f.read()
-
-        bits = []
-        for char in html_content:
-            if char in self.MARKERS:
-                bits.append(self.MARKERS[char])
-
-        if len(bits) < 32:
-            raise ValueError("Недостаточно данных для извлечения")
-
-        cipher = bits_to_bytes(bits)
-        ks = keystream_bytes(key.encode("utf-8"), len(cipher))
-        payload = bytes(a ^ b for a, b in zip(cipher, ks))
-
-        msg_len = int.from_bytes(payload[:4], "big")
-        msg_bytes = payload[4: 4 + msg_len]
+        self.MARKERS = ZW_ALPHABET
+
+    def embed(self, cover_file: str, secret: str, key: str, output_file: str, progress=None):
+        with PhaseTimer("embed", self, cover_file) as timer:
+            cipher = build_payload(secret_bytes(secret), key, self.keystream_mode,
+                                   self.compression, self.compression_level, timer)
+            bits_count = 8 * len(cipher)
+            with timer.phase("bitpack"):
+                markers = zero_width_markers(cipher, self.bits_per_marker)
+
+            if self.parser == "stream":
+                with timer.phase("rewrite"), atomic_output(output_file) as tmp:
+                    used = embed_html_file(cover_file, tmp, markers, self._rewrite_node, progress)
+                    if used < len(markers):
+                        raise ValueError("Недостаточно символов для внедрения")
+                self.last_timing = timer.finish(bits_count)
+                return self.last_timing["seconds"], bits_count
+
+            with timer.phase("parse"):
+                html_content = read_html_file(cover_file)
+            stego_html, used = embed_html(html_content, markers, self._rewrite_node, self.parser, progress, timer)
+            if used < len(markers):
+                raise ValueError("Недостаточно символов для внедрения")
+
+            with timer.phase("serialize"), open(output_file, 'w', encoding='utf-8') as f:
+                f.write(stego_html)
+
+            self.last_timing = timer.finish(bits_count)
+            return self.last_timing["seconds"], bits_count
+
+    def _rewrite_node(self, text: str, markers: str, pos: int):
+        # Маркер после каждого непробельного символа; пробельные участки не трогаются
+        text = text.translate(_ZW_STRIP)
+        new_text, used = insert_after_letters(text, markers[pos:pos + len(text)])
+        return new_text, pos + used
+
+    def _strip_node(self, text: str):
+        cover = text.translate(_ZW_STRIP)
+        return cover, len(text) - len(cover), count_letters(cover)
+
+    def update(self, stego_file: str, secret: str, key: str, output_file: str = None, progress=None):
+        """Новое сообщение в готовом стего-файле (см. StegoZeroWidthDocx.update).
+
+        Возвращает (время, бит, измененных узлов).
+        """
+        with PhaseTimer("update", self, stego_file) as timer:
+            with timer.phase("parse"):
+                html_content = read_html_file(stego_file)
+
+            cipher = build_payload(secret_bytes(secret), key, self.keystream_mode,
+                                   self.compression, self.compression_level, timer)
+            bits_count = 8 * len(cipher)
+            with timer.phase("bitpack"):
+                markers = zero_width_markers(cipher, self.bits_per_marker)
+
+            stego_html, used, changed = update_html(html_content, markers, self._rewrite_node, self._strip_node,
+                                                    self.parser, progress=progress, timer=timer)
+            if used < len(markers):
+                raise ValueError("Недостаточно символов для внедрения")
+
+            with timer.phase("serialize"), atomic_output(output_file or stego_file) as tmp:
+                with open(tmp, 'w', encoding='utf-8') as f:
+                    f.write(stego_html)
+
+            self.last_timing = timer.finish(bits_count)
+            return self.last_timing["seconds"], bits_count, changed
+
+    def extract(self, stego_file: str, key: str, progress=None) -> str:
+        msg_bytes, extract_time, bits_count = self.extract_bytes(stego_file, key, progress)
+        return msg_bytes.decode("utf-8"), extract_time, bits_count
+
+    def extract_bytes(self, stego_file: str, key: str, progress=None):
+        with PhaseTimer("extract", self, stego_file) as timer:
+            # Маркеры ищутся в байтах файла через mmap блоками, пока сообщение не собрано;
+            # файл не декодируется и не разбирается (read_html_file все равно отбрасывает только битые байты)
+            bit_chunks = zero_width_bits(iter_file_marker_bits(stego_file, self.MARKERS))
+            msg_bytes, bits_count = read_payload(bit_chunks, key, self.keystream_mode, progress, timer)
+
+            self.last_timing = timer.finish(bits_count)
+            return msg_bytes, self.last_timing["seconds"], bits_count
+
+
+# ========== PDF ==========
+
+class StegoSpacesPDF:
+    def __init__(self, keystream_mode: str = "sha256", compression: str = "none", compression_level: int = None,
+                 font_path: str = None):
+        self.keystream_mode = keystream_mode
+        self.compression = compression
+        self.compression_level = compression_level
+        self.font_path = font_path  # TTF для вывода; None - первый из PDF_FONT_CANDIDATES
+        self.SPACE_0 = "\u0020"
+        self.SPACE_1 = "\u202F"
 
-        extract_time = time.time() - start_time
-        return msg_bytes.decode("utf-8"), extract_time, len(bits)
+    def embed(self, cover_file: str, secret: str, key: str, output_file: str, progress=None):
+        with PhaseTimer("embed", self, cover_file) as timer:
+            cipher = build_payload(secret_bytes(secret), key, self.keystream_mode,
+                                   self.compression, self.compression_level, timer)
+            with timer.phase("bitpack"):
+                bits = bytes_to_bits(cipher)
+                markers = bits_to_markers(bits, (self.SPACE_0, self.SPACE_1))
+
+            # Без места под сообщение временный файл удаляется, а прежний output_file остается
+            with atomic_output(output_file) as tmp:
+                used = embed_pdf(cover_file, tmp, markers, self._rewrite_page, self.font_path, progress, timer)
+                if used < len(markers):
+                    raise ValueError("Недостаточно пробелов для внедрения")
+
+            self.last_timing = timer.finish(len(bits))
+            return self.last_timing["seconds"], len(bits)
+
+    def _rewrite_page(self, text: str, markers: str, pos: int):
+        # Как в StegoSpacesHTML: каждый обычный пробел страницы - позиция для бита
+        parts = text.split(self.SPACE_0)
+        if len(parts) < 2:
+            return None, pos
+        chunk = markers[pos:pos + len(parts) - 1]
+        separators = chunk + self.SPACE_0 * (len(parts) - 1 - len(chunk))
+        return interleave(parts, separators), pos + len(chunk)
+
+    def extract(self, stego_file: str, key: str, progress=None) -> str:
+        msg_bytes, extract_time, bits_count = self.extract_bytes(stego_file, key, progress)
+        return msg_bytes.decode("utf-8"), extract_time, bits_count
+
+    def extract_bytes(self, stego_file: str, key: str, progress=None):
+        with PhaseTimer("extract", self, stego_file) as timer:
+            # Страницы читаются по одной, пока не набрано нужное число бит
+            texts = iter_pdf_pages_text(stego_file)
+            bit_chunks = iter_texts_bits(texts, (self.SPACE_0, self.SPACE_1))
+            msg_bytes, bits_count = read_payload(bit_chunks, key, self.keystream_mode, progress, timer)
+
+            self.last_timing = timer.finish(bits_count)
+            return msg_bytes, self.last_timing["seconds"], bits_count
+
+
+class StegoZeroWidthPDF:
+    def __init__(self, keystream_mode: str = "sha256", bits_per_marker: int = 1, compression: str = "none",
+                 compression_level: int = None, font_path: str = None):
+        self.keystream_mode = keystream_mode
+        self.bits_per_marker = int(bits_per_marker)  # см. StegoZeroWidthDocx
+        self.compression = compression
+        self.compression_level = compression_level
+        self.font_path = font_path  # см. StegoSpacesPDF
+        self.MARKERS = ZW_ALPHABET
+
+    def embed(self, cover_file: str, secret: str, key: str, output_file: str, progress=None):
+        with PhaseTimer("embed", self, cover_file) as timer:
+            cipher = build_payload(secret_bytes(secret), key, self.keystream_mode,
+                                   self.compression, self.compression_level, timer)
+            bits_count = 8 * len(cipher)
+            with timer.phase("bitpack"):
+                markers = zero_width_markers(cipher, self.bits_per_marker)
+
+            # Без места под сообщение временный файл удаляется, а прежний output_file остается
+            with atomic_output(output_file) as tmp:
+                used = embed_pdf(cover_file, tmp, markers, self._rewrite_page, self.font_path, progress, timer)
+                if used < len(markers):
+                    raise ValueError("Недостаточно символов для внедрения")
+
+            self.last_timing = timer.finish(bits_count)
+            return self.last_timing["seconds"], bits_count
+
+    def _rewrite_page(self, text: str, markers: str, pos: int):
+        # Маркер после каждого непробельного символа страницы
+        text = text.translate(_ZW_STRIP)
+        new_text, used = insert_after_letters(text, markers[pos:pos + len(text)])
+        return new_text, pos + used
+
+    def extract(self, stego_file: str, key: str, progress=None) -> str:
+        msg_bytes, extract_time, bits_count = self.extract_bytes(stego_file, key, progress)
+        return msg_bytes.decode("utf-8"), extract_time, bits_count
+
+    def extract_bytes(self, stego_file: str, key: str, progress=None):
+        with PhaseTimer("extract", self, stego_file) as timer:
+            texts = iter_pdf_pages_text(stego_file)
+            bit_chunks = zero_width_bits(iter_texts_bits(texts, self.MARKERS))
+            msg_bytes, bits_count = read_payload(bit_chunks, key, self.keystream_mode, progress, timer)
+
+            self.last_timing = timer.finish(bits_count)
+            return msg_bytes, self.last_timing["seconds"], bits_count
+
+
+# ---------- Реестр методов ----------
+
+# (формат, метод) -> класс; формат определяется по расширению файла
+STEGO_METHODS = {
+    ("docx", "spaces"): StegoSpacesDocx,
+    ("html", "spaces"): StegoSpacesHTML,
+    ("docx", "zero-width"): StegoZeroWidthDocx,
+    ("html", "zero-width"): StegoZeroWidthHTML,
+    ("pdf", "spaces"): StegoSpacesPDF,
+    ("pdf", "zero-width"): StegoZeroWidthPDF,
+}
+
+
+def file_format(path: str) -> str:
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".docx":
+        return "docx"
+    if ext in (".html", ".htm"):
+        return "html"
+    if ext == ".pdf":
+        return "pdf"
+    raise ValueError(f"Неподдерживаемый формат файла: {path}")
+
+
+def stego_method(path: str, method: str, **options):
+    """Экземпляр класса для файла path и метода "spaces"/"zero-width".
+
+    Параметры, которых нет у конструктора (parser для DOCX и т.п.), пропускаются,
+    так что один набор опций годится для обложек разных форматов.
+    """
+    key = (file_format(path), method)
+    if key not in STEGO_METHODS:
+        raise ValueError(f"Неизвестный метод: {method}")
+    cls = STEGO_METHODS[key]
+    code = cls.__init__.__code__
+    accepted = code.co_varnames[1:code.co_argcount]
+    return cls(**{name: value for name, value in options.items() if name in accepted})
 
 
 # ---------- GUI С ИЗМЕРЕНИЕМ СКОРОСТИ ----------
@@ -356,7 +2121,7 @@ class StegoZeroWidthHTML:
 class StegoApp:
     def __init__(self, root):
         self.root = root
-        self.root.title("Стеганография - DOCX, HTML (с измерением скорости)")
+        self.root.title("Стеганография - DOCX, HTML, PDF (с измерением скорости)")
         self.root.geometry("900x700")
 
         # Переменные для хранения статистики
@@ -364,17 +2129,27 @@ class StegoApp:
         self.last_extract_time = tk.DoubleVar(value=0.0)
         self.last_bits_count = tk.IntVar(value=0)
 
+        # Фоновая операция: поток, флаг отмены и прогресс в процентах
+        self.worker = None
+        self.cancel_event = threading.Event()
+        self.progress_var = tk.DoubleVar(value=0.0)
+        self.status_var = tk.StringVar(value="Готово")
+        self.phases_var = tk.StringVar(value="")
+
         main_notebook = ttk.Notebook(root)
         main_notebook.pack(fill="both", expand=True, padx=10, pady=10)
 
         self.tab_docx = ttk.Frame(main_notebook)
         self.tab_html = ttk.Frame(main_notebook)
+        self.tab_pdf = ttk.Frame(main_notebook)
 
         main_notebook.add(self.tab_docx, text="DOCX")
         main_notebook.add(self.tab_html, text="HTML")
+        main_notebook.add(self.tab_pdf, text="PDF")
 
         self.init_docx_tab()
         self.init_html_tab()
+        self.init_pdf_tab()
 
         # Панель статистики
         self.create_stats_panel()
@@ -397,10 +2172,106 @@ class StegoApp:
         # Количество бит
         ttk.Label(stats_frame, text="Бит обработано:").grid(row=2, column=0, sticky="w")
         ttk.Label(stats_frame, textvariable=self.last_bits_count).grid(row=2, column=1, sticky="w")
+        # Разбивка последней операции по фазам (PhaseTimer)
+        ttk.Label(stats_frame, textvariable=self.phases_var,
+                  font=("Arial", 9)).grid(row=2, column=2, columnspan=2, sticky="w")
 
-        # Сравнение методов
-        ttk.Label(stats_frame, text="Space быстрее Zero-Width в 1.8-2.2 раза",
+        # Сравнение методов по последнему замеру benchmark.py
+        self.comparison_var = tk.StringVar(value=self.benchmark_summary_text())
+        ttk.Label(stats_frame, textvariable=self.comparison_var,
                   font=("Arial", 9, "italic")).grid(row=3, column=0, columnspan=3, sticky="w", pady=5)
+        tk.Button(stats_frame, text="Замерить", command=self.run_benchmark).grid(row=3, column=3, padx=5)
+
+        # Прогресс текущей операции
+        ttk.Label(stats_frame, textvariable=self.status_var).grid(row=4, column=0, sticky="w")
+        ttk.Progressbar(stats_frame, variable=self.progress_var, maximum=100,
+                        length=400).grid(row=4, column=1, columnspan=2, sticky="we", padx=5)
+        self.cancel_button = tk.Button(stats_frame, text="Отмена", state=tk.DISABLED,
+                                       command=self.cancel_operation)
+        self.cancel_button.grid(row=4, column=3, padx=5)
+
+    def benchmark_summary_text(self, report=None) -> str:
+        import benchmark
+
+        report = report or benchmark.load_results()
+        if not report or not report.get("summary"):
+            return "Нет замеров скорости: нажмите «Замерить»"
+        parts = [f"{fmt.upper()}: {benchmark.describe_ratio(s['embed_ratio'])} ({s['size_mb']:g} МБ)"
+                 for fmt, s in report["summary"].items()]
+        return "; ".join(parts) + f"\nЗамер от {report['created']}"
+
+    def run_benchmark(self):
+        if self.is_busy():
+            return
+        import benchmark
+
+        def done(report):
+            benchmark.save_results(report)
+            self.comparison_var.set(self.benchmark_summary_text(report))
+
+        # Быстрый замер на небольших обложках; полный набор размеров - python benchmark.py
+        self.run_in_background("Замер скорости...",
+                               lambda progress: benchmark.run_suite([0.1, 1], memory=False, progress=progress),
+                               done, "Ошибка при замере")
+
+    def run_in_background(self, title, task, on_success, error_prefix):
+        """Выполняет task(progress) в отдельном потоке, не блокируя главный цикл Tk.
+
+        Поток только записывает состояние в словарь; виджеты обновляет _poll_worker
+        из главного потока через root.after.
+        """
+        state = {"done": 0, "total": 0, "result": None, "error": None, "cancelled": False}
+        cancel_event = self.cancel_event
+        cancel_event.clear()
+
+        def progress(done, total):
+            if cancel_event.is_set():
+                raise StegoCancelled()
+            state["done"], state["total"] = done, total
+
+        def target():
+            try:
+                state["result"] = task(progress)
+            except StegoCancelled:
+                state["cancelled"] = True
+            except Exception as e:
+                state["error"] = e
+
+        self.progress_var.set(0)
+        self.status_var.set(title)
+        self.cancel_button.config(state=tk.NORMAL)
+        self.worker = threading.Thread(target=target, daemon=True)
+        self.worker.start()
+        self.root.after(100, self._poll_worker, state, on_success, error_prefix)
+
+    def _poll_worker(self, state, on_success, error_prefix):
+        if state["total"]:
+            self.progress_var.set(100.0 * state["done"] / state["total"])
+        if self.worker.is_alive():
+            self.root.after(100, self._poll_worker, state, on_success, error_prefix)
+            return
+
+        self.cancel_button.config(state=tk.DISABLED)
+        if state["cancelled"]:
+            self.status_var.set("Отменено")
+            self.progress_var.set(0)
+        elif state["error"] is not None:
+            self.status_var.set("Ошибка")
+            messagebox.showerror("Ошибка", f"{error_prefix}:\n{str(state['error'])}")
+        else:
+            self.status_var.set("Готово")
+            self.progress_var.set(100)
+            on_success(state["result"])
+
+    def is_busy(self) -> bool:
+        if self.worker is not None and self.worker.is_alive():
+            messagebox.showwarning("Подождите", "Предыдущая операция еще выполняется")
+            return True
+        return False
+
+    def cancel_operation(self):
+        self.cancel_event.set()
+        self.status_var.set("Отмена...")
 
     def create_method_tab(self, parent, methods, format_name):
         notebook = ttk.Notebook(parent)
@@ -418,6 +2289,26 @@ class StegoApp:
         key_entry = tk.Entry(parent, width=60, font=("Arial", 10))
         key_entry.pack(pady=5)
 
+        tk.Label(parent, text="Гамма:", font=("Arial", 10, "bold")).pack(pady=5)
+        mode_var = tk.StringVar(value=method_class.keystream_mode)
+        ttk.Combobox(parent, textvariable=mode_var, values=KEYSTREAM_MODES,
+                     state="readonly", width=15).pack(pady=5)
+
+        # Сжатие тоже нужно только при встраивании: кодек записан в заголовке
+        tk.Label(parent, text="Сжатие:", font=("Arial", 10, "bold")).pack(pady=5)
+        compression_var = tk.StringVar(value=method_class.compression)
+        compression_var.trace_add("write", lambda *_: setattr(method_class, "compression", compression_var.get()))
+        ttk.Combobox(parent, textvariable=compression_var, values=COMPRESSION_CODECS,
+                     state="readonly", width=15).pack(pady=5)
+
+        if hasattr(method_class, "bits_per_marker"):
+            # Влияет только на встраивание: при извлечении алфавит определяется по файлу
+            tk.Label(parent, text="Бит на маркер:", font=("Arial", 10, "bold")).pack(pady=5)
+            bits_var = tk.StringVar(value=str(method_class.bits_per_marker))
+            bits_var.trace_add("write", lambda *_: setattr(method_class, "bits_per_marker", int(bits_var.get())))
+            ttk.Combobox(parent, textvariable=bits_var, values=ZW_BITS_PER_MARKER,
+                         state="readonly", width=15).pack(pady=5)
+
         tk.Label(parent, text="Сообщение:", font=("Arial", 10, "bold")).pack(pady=5)
         msg_text = tk.Text(parent, width=80, height=8, font=("Arial", 10))
         msg_text.pack(pady=5)
@@ -426,11 +2317,13 @@ class StegoApp:
         button_frame.pack(pady=10)
 
         tk.Button(button_frame, text="Встроить сообщение",
-                  command=lambda: self.embed_message(format_name, method_name, method_class, key_entry, msg_text),
+                  command=lambda: self.embed_message(format_name, method_name, method_class, key_entry, msg_text,
+                                                     mode_var),
                   bg="lightblue", font=("Arial", 10, "bold")).pack(side=tk.LEFT, padx=5)
 
         tk.Button(button_frame, text="Извлечь сообщение",
-                  command=lambda: self.extract_message(format_name, method_name, method_class, key_entry),
+                  command=lambda: self.extract_message(format_name, method_name, method_class, key_entry,
+                                                       mode_var),
                   bg="lightgreen", font=("Arial", 10, "bold")).pack(side=tk.LEFT, padx=5)
 
     def init_docx_tab(self):
@@ -449,10 +2342,22 @@ class StegoApp:
         self.html_methods = html_methods
         self.create_method_tab(self.tab_html, html_methods, "html")
 
-    def embed_message(self, format_name, method_name, method_class, key_entry, msg_text):
+    def init_pdf_tab(self):
+        pdf_methods = {
+            "Пробелы": StegoSpacesPDF(),
+            "Zero-Width": StegoZeroWidthPDF()
+        }
+        self.pdf_methods = pdf_methods
+        self.create_method_tab(self.tab_pdf, pdf_methods, "pdf")
+
+    def embed_message(self, format_name, method_name, method_class, key_entry, msg_text, mode_var):
+        if self.is_busy():
+            return
+
         file_types = {
             "docx": [("Word files", "*.docx")],
-            "html": [("HTML files", "*.html *.htm")]
+            "html": [("HTML files", "*.html *.htm")],
+            "pdf": [("PDF files", "*.pdf")]
         }
 
         cover = filedialog.askopenfilename(filetypes=file_types[format_name])
@@ -477,13 +2382,15 @@ class StegoApp:
         if not output:
             return
 
-        try:
-            # Измеряем время встраивания
-            embed_time, bits_count = method_class.embed(cover, secret, key, output)
+        method_class.keystream_mode = mode_var.get()
+
+        def done(result):
+            embed_time, bits_count = result
 
             # Обновляем статистику
             self.last_embed_time.set(round(embed_time, 4))
             self.last_bits_count.set(bits_count)
+            self.phases_var.set(describe_phases(method_class.last_timing))
 
             messagebox.showinfo("Успех",
                                 f"Сообщение встроено!\n"
@@ -491,13 +2398,20 @@ class StegoApp:
                                 f"Метод: {method_name}\n"
                                 f"Время: {embed_time:.4f} сек\n"
                                 f"Бит: {bits_count}")
-        except Exception as e:
-            messagebox.showerror("Ошибка", f"Ошибка при встраивании:\n{str(e)}")
 
-    def extract_message(self, format_name, method_name, method_class, key_entry):
+        # Измеряем время встраивания (в фоновом потоке)
+        self.run_in_background("Встраивание...",
+                               lambda progress: method_class.embed(cover, secret, key, output, progress),
+                               done, "Ошибка при встраивании")
+
+    def extract_message(self, format_name, method_name, method_class, key_entry, mode_var):
+        if self.is_busy():
+            return
+
         file_types = {
             "docx": [("Word files", "*.docx")],
-            "html": [("HTML files", "*.html *.htm")]
+            "html": [("HTML files", "*.html *.htm")],
+            "pdf": [("PDF files", "*.pdf")]
         }
 
         stego_file = filedialog.askopenfilename(filetypes=file_types[format_name])
@@ -509,13 +2423,15 @@ class StegoApp:
             messagebox.showerror("Ошибка", "Введите ключ")
             return
 
-        try:
-            # Измеряем время извлечения
-            msg, extract_time, bits_count = method_class.extract(stego_file, key)
+        method_class.keystream_mode = mode_var.get()
+
+        def done(result):
+            msg, extract_time, bits_count = result
 
             # Обновляем статистику
             self.last_extract_time.set(round(extract_time, 4))
             self.last_bits_count.set(bits_count)
+            self.phases_var.set(describe_phases(method_class.last_timing))
 
             messagebox.showinfo("Извлечённое сообщение",
                                 f"Формат: {format_name.upper()}\n"
@@ -523,20 +2439,24 @@ class StegoApp:
                                 f"Время: {extract_time:.4f} сек\n"
                                 f"Бит: {bits_count}\n\n"
                                 f"Сообщение:\n{msg}")
-        except Exception as e:
-            messagebox.showerror("Ошибка", f"Ошибка при извлечении:\n{str(e)}")
+
+        # Измеряем время извлечения (в фоновом потоке)
+        self.run_in_background("Извлечение...",
+                               lambda progress: method_class.extract(stego_file, key, progress),
+                               done, "Ошибка при извлечении")
 
 
 # ---------- Запуск ----------
 if __name__ == "__main__":
     try:
+        import numpy
         import PyPDF2
         from reportlab.pdfgen import canvas
         from bs4 import BeautifulSoup
     except ImportError as e:
         print(f"Ошибка: Не установлены необходимые библиотеки: {e}")
         print("Установите их командами:")
-        print("pip install pypdf2 reportlab beautifulsoup4 python-docx")
+        print("pip install numpy pypdf2 reportlab beautifulsoup4 python-docx")
         exit(1)
 
     root = tk.Tk()
@@ -19,16 +19,92 @@ import warnings
 import time
 import random
 import json
+import os
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
 from nltk.tokenize import word_tokenize
 
 warnings.filterwarnings('ignore')
 
+# Тексты раздаются процессам пачками: на один текст накладные расходы пула больше самой обработки
+PREPROCESS_CHUNK = 512
+# Словарь отзывов - десятки тысяч слов; память под леммы ограничена, чтобы редкие слова не копились бесконечно
+LEMMA_CACHE_SIZE = 100000
+# Таблица лемм по умолчанию лежит рядом со скриптом
+LEMMA_DB = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'lemmas.sqlite')
+# Сравнение скорости предобработки идет на выборке: прежняя цепочка слишком медленна для всего корпуса
+COMPARE_SAMPLE = 2000
+
+# Шум удаляется в том же порядке, что и раньше: после удаления тега URL или упоминание могут склеиться
+_HTML_TAG = re.compile(r'<.*?>')
+_URL = re.compile(r'http\S+')
+_MENTION = re.compile(r'@\w+|#\w+')
+_NON_LETTER = re.compile(r'[^a-zA-Z\s]+')
+_WHITESPACE = re.compile(r'\s+')
+# Слитные формы, которые word_tokenize делит на два токена; остальной очищенный текст он режет по пробелам
+_SPLIT_CONTRACTIONS = {
+    'cannot': ('can', 'not'), 'gimme': ('gim', 'me'), 'gonna': ('gon', 'na'),
+    'gotta': ('got', 'ta'), 'lemme': ('lem', 'me'), 'wanna': ('wan', 'na'),
+}
+
+
+class LemmaTable:
+    """Таблица токен -> лемма в SQLite: переживает перезапуски и общая для всех процессов пула.
+
+    Новые леммы копятся в памяти и записываются пачками по batch_size (и при flush), чтобы
+    процессы не блокировали базу на каждом слове.
+    """
+
+    def __init__(self, path, batch_size=1000):
+        self.path = path
+        self.batch_size = batch_size
+        self._pending = {}
+        self.conn = sqlite3.connect(path, timeout=60)
+        # WAL: читатели не ждут пишущий процесс
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        with self.conn:
+            self.conn.execute('CREATE TABLE IF NOT EXISTS lemmas (token TEXT PRIMARY KEY, lemma TEXT NOT NULL)')
+
+    def get(self, token):
+        lemma = self._pending.get(token)
+        if lemma is None:
+            row = self.conn.execute('SELECT lemma FROM lemmas WHERE token = ?', (token,)).fetchone()
+            if row:
+                lemma = row[0]
+        return lemma
+
+    def put(self, token, lemma):
+        self._pending[token] = lemma
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self._pending:
+            return
+        # Другой процесс мог уже записать то же слово - лемма у него та же
+        with self.conn:
+            self.conn.executemany('INSERT OR IGNORE INTO lemmas VALUES (?, ?)', self._pending.items())
+        self._pending.clear()
+
+    def close(self):
+        self.flush()
+        self.conn.close()
+
+
 class TextPreprocessor:
-    def __init__(self):
+    def __init__(self, stop_words=None, lemma_cache_size=LEMMA_CACHE_SIZE, lemma_db=None):
         self._download_nltk_resources()
         self.lemmatizer = WordNetLemmatizer()
-        self.stop_words = set(stopwords.words('english'))
-        self.stop_words.update(['movie', 'film', 'watch', 'see', 'seen', 'make', 'made', 'get', 'got'])
+        if stop_words is None:
+            stop_words = set(stopwords.words('english'))
+            stop_words.update(['movie', 'film', 'watch', 'see', 'seen', 'make', 'made', 'get', 'got'])
+        self.stop_words = set(stop_words)
+        # Каждое слово лемматизируется один раз: дальше лемма берется из памяти, а между запусками - из таблицы
+        self.lemma_cache_size = lemma_cache_size
+        self.lemma_db = lemma_db
+        self.lemma_table = LemmaTable(lemma_db) if lemma_db else None
+        self.lemmatize = lru_cache(maxsize=lemma_cache_size)(self._lookup_lemma)
 
     def _download_nltk_resources(self):
         resources = ['punkt', 'stopwords', 'wordnet', 'omw-1.4']
@@ -41,14 +117,53 @@ class TextPreprocessor:
     def clean_text(self, text):
         if not isinstance(text, str) or pd.isna(text):
             return ""
-        text = re.sub(r'<.*?>', '', text)
-        text = re.sub(r'http\S+', '', text)
-        text = re.sub(r'@\w+|#\w+', '', text)
-        text = re.sub(r'[^a-zA-Z\s]', '', text)
+        text = _HTML_TAG.sub('', text)
+        text = _URL.sub('', text)
+        text = _MENTION.sub('', text)
+        text = _NON_LETTER.sub('', text)
         text = text.lower()
-        text = re.sub(r'\s+', ' ', text).strip()
+        text = _WHITESPACE.sub(' ', text).strip()
         return text
 
+    def normalize_tokens(self, text):
+        """То же, что clean_text + word_tokenize + фильтр стоп-слов, но без повторных проходов по тексту.
+
+        Шаблоны шума запускаются, только если в тексте есть их первый символ; очищенный текст
+        содержит лишь буквы и пробелы, поэтому вместо word_tokenize хватает split.
+        """
+        if not isinstance(text, str):
+            return []
+        if '<' in text:
+            text = _HTML_TAG.sub('', text)
+        if 'http' in text:
+            text = _URL.sub('', text)
+        if '@' in text or '#' in text:
+            text = _MENTION.sub('', text)
+        text = _NON_LETTER.sub('', text).lower()
+
+        stop_words = self.stop_words
+        tokens = []
+        for word in text.split():
+            for token in _SPLIT_CONTRACTIONS.get(word, (word,)):
+                if len(token) > 2 and token not in stop_words:
+                    tokens.append(token)
+        return tokens
+
+    def _lookup_lemma(self, token):
+        if self.lemma_table is None:
+            return self.lemmatizer.lemmatize(token)
+        lemma = self.lemma_table.get(token)
+        if lemma is None:
+            lemma = self.lemmatizer.lemmatize(token)
+            self.lemma_table.put(token, lemma)
+        return lemma
+
+    def lemmatize_tokens(self, tokens):
+        try:
+            return ' '.join(map(self.lemmatize, tokens))
+        except Exception as e:
+            return ' '.join(tokens)
+
     def tokenize_and_lemmatize(self, text):
         try:
             tokens = word_tokenize(text)
@@ -61,12 +176,100 @@ class TextPreprocessor:
         except Exception as e:
             return text
 
-    def preprocess(self, texts):
+    def preprocess(self, texts, workers=1, chunk_size=PREPROCESS_CHUNK):
+        """Очистка, токенизация и лемматизация; результаты идут в порядке texts.
+
+        workers > 1 (или None - по числу ядер) включает пул процессов: тексты режутся на пачки
+        по chunk_size, а лемматизатор и стоп-слова создаются один раз в каждом процессе.
+        """
+        texts = list(texts)
+        if workers == 1 or len(texts) <= chunk_size:
+            return self._preprocess_serial(texts)
+
+        chunks = [texts[i:i + chunk_size] for i in range(0, len(texts), chunk_size)]
+        processed_texts = []
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_preprocess_worker,
+                                 initargs=(self.stop_words, self.lemma_cache_size, self.lemma_db)) as pool:
+            # map отдает пачки в порядке подачи, поэтому порядок текстов сохраняется
+            for chunk in pool.map(_preprocess_chunk, chunks):
+                processed_texts.extend(chunk)
+        return processed_texts
+
+    def _preprocess_serial(self, texts):
+        processed_texts = [self.lemmatize_tokens(self.normalize_tokens(text)) for text in texts]
+        if self.lemma_table is not None:
+            self.lemma_table.flush()
+        return processed_texts
+
+    def _preprocess_legacy(self, texts):
+        # Прежняя цепочка clean_text -> word_tokenize, оставлена для сравнения скорости
         cleaned_texts = [self.clean_text(text) for text in texts]
         processed_texts = [self.tokenize_and_lemmatize(text) for text in cleaned_texts]
         return processed_texts
 
 
+# Препроцессор рабочего процесса: создается инициализатором пула один раз на процесс
+_worker_preprocessor = None
+
+
+def _init_preprocess_worker(stop_words, lemma_cache_size, lemma_db):
+    global _worker_preprocessor
+    _worker_preprocessor = TextPreprocessor(stop_words, lemma_cache_size, lemma_db)
+    # WordNet загружается лениво при первом обращении - прогреваем до первой пачки
+    _worker_preprocessor.lemmatizer.lemmatize('warmup')
+
+
+def _preprocess_chunk(texts):
+    return _worker_preprocessor._preprocess_serial(texts)
+
+
+def _best_time(func, texts, repeats, reset=None):
+    best = float('inf')
+    for _ in range(repeats):
+        if reset:
+            reset()
+        start = time.perf_counter()
+        result = func(texts)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def compare_preprocessing(preprocessor, texts, repeats=3, sample_size=COMPARE_SAMPLE):
+    """Скорость прежней цепочки (clean_text + word_tokenize) и однопроходной нормализации на одном корпусе.
+
+    Замеряются два этапа: токенизация с фильтром стоп-слов и полная предобработка с лемматизацией,
+    на случайной выборке не больше sample_size текстов. Лемматизация идет без таблицы лемм на диске,
+    а память лемм очищается перед каждым замером, чтобы повторы не ускоряли однопроходный вариант.
+    Возвращает словарь текстов в секунду по каждому этапу и признак совпадения результатов.
+    """
+    texts = list(texts)
+    if len(texts) > sample_size:
+        texts = random.Random(0).sample(texts, sample_size)
+    preprocessor = TextPreprocessor(preprocessor.stop_words, preprocessor.lemma_cache_size)
+    stop_words = preprocessor.stop_words
+
+    def legacy_tokens(batch):
+        return [[token for token in word_tokenize(preprocessor.clean_text(text))
+                 if token not in stop_words and len(token) > 2] for text in batch]
+
+    def fused_tokens(batch):
+        return [preprocessor.normalize_tokens(text) for text in batch]
+
+    report = {'texts': len(texts)}
+    stages = (('tokenize', legacy_tokens, fused_tokens),
+              ('full', preprocessor._preprocess_legacy, preprocessor._preprocess_serial))
+    for stage, legacy, fused in stages:
+        legacy_time, legacy_result = _best_time(legacy, texts, repeats)
+        fused_time, fused_result = _best_time(fused, texts, repeats, preprocessor.lemmatize.cache_clear)
+        report[stage] = {
+            'legacy_texts_per_second': len(texts) / legacy_time if legacy_time else 0.0,
+            'fused_texts_per_second': len(texts) / fused_time if fused_time else 0.0,
+            'speedup': legacy_time / fused_time if fused_time else 0.0,
+            'same': legacy_result == fused_result,
+        }
+    return report
+
+
 class WebScraper:
     def __init__(self):
         self.session = requests.Session()
@@ -222,10 +425,13 @@ class WebScraper:
 
 
 class TextClassifier:
-    def __init__(self):
+    def __init__(self, workers=1, lemma_db=None, benchmark_preprocessing=False):
         self.vectorizer = None
         self.model = None
-        self.preprocessor = TextPreprocessor()
+        self.preprocessor = TextPreprocessor(lemma_db=lemma_db)
+        self.workers = workers
+        # Сравнение скорости предобработки при каждом обучении - только по запросу
+        self.benchmark_preprocessing = benchmark_preprocessing
         self.scraper = WebScraper()
 
     def create_dataset(self):
@@ -303,8 +509,19 @@ class TextClassifier:
         print("=" * 60)
         print()
 
+        # Сравнение прежней цепочки и однопроходной нормализации на выборке из этого же корпуса
+        if self.benchmark_preprocessing:
+            report = compare_preprocessing(self.preprocessor, df['text'])
+            print(f"СКОРОСТЬ ПРЕДОБРАБОТКИ (текстов/сек, выборка {report['texts']}):")
+            for stage, title in (('tokenize', 'Токенизация'), ('full', 'С лемматизацией')):
+                r = report[stage]
+                print(f"  {title}: прежняя {r['legacy_texts_per_second']:.0f}, "
+                      f"однопроходная {r['fused_texts_per_second']:.0f} "
+                      f"(x{r['speedup']:.1f}, результаты {'совпадают' if r['same'] else 'различаются'})")
+            print()
+
         # Продолжение обычной предобработки
-        processed_texts = self.preprocessor.preprocess(df['text'])
+        processed_texts = self.preprocessor.preprocess(df['text'], self.workers)
 
         X_train, X_test, y_train, y_test = train_test_split(
             processed_texts, df['sentiment'], test_size=0.2, random_state=42, stratify=df['sentiment']
@@ -482,7 +699,7 @@ class TextClassifier:
         print("КЛАССИФИКАЦИЯ ТЕКСТОВ")
         print("=" * 50)
 
-        processed_texts = self.preprocessor.preprocess(texts)
+        processed_texts = self.preprocessor.preprocess(texts, self.workers)
         texts_vec = self.vectorizer.transform(processed_texts)
         predictions = self.model.predict(texts_vec)
 
@@ -568,7 +785,7 @@ class TextClassifier:
 
 
 def main():
-    classifier = TextClassifier()
+    classifier = TextClassifier(workers=os.cpu_count(), lemma_db=LEMMA_DB, benchmark_preprocessing=True)
 
     # 1. Создание датасета
     df = classifier.create_dataset()